@@ -0,0 +1,29 @@
+"""
+
+Compiles YAML instances into a binary .npz bundle, see utils/instance.py
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+
+from utils.instance import load_yaml, save_bundle, instance_name
+from run_benchmark import collect_instances
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("instances", nargs='+', help="instance files or directories of instance files")
+    parser.add_argument("output", help="output .npz bundle")
+    args = parser.parse_args()
+
+    file_names = collect_instances(args.instances)
+    names = [instance_name(file_name) for file_name in file_names]
+    if len(set(names)) != len(names):
+        print("Instance names are not unique")
+        return
+    params = [load_yaml(file_name) for file_name in file_names]
+    save_bundle(args.output, params, names)
+    print(str(len(params)) + " instances written to " + args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+
+Batch benchmark runner for the centralized planners
+
+Instances are fanned out over a process pool, each run with a timeout and
+a memory cap. One row per (instance, solver) is appended to a CSV or
+JSON-lines file as soon as it finishes, so an interrupted run can be
+resumed by running the same command again.
+
+"""
+import sys
+sys.path.insert(0, '../')
+sys.path.append('../sipp')
+import os
+import re
+import csv
+import json
+import time
+import signal
+import resource
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cbs.cbs import Environment, CBS
+from coop_astar.coop_astar import Coop_Astar
+from sipp.sipp import SippPlanner
+from utils.instance import load_instance, list_instances, BUNDLE_EXTENSION
+from utils.profiler import SearchProfiler
+
+FIELDS = ['instance', 'solver', 'agents', 'success', 'status', 'runtime', 'high_level_expansions',
+          'low_level_expansions', 'makespan', 'sum_of_costs']
+
+class InstanceTimeout(Exception):
+    pass
+
+def raise_timeout(signum, frame):
+    raise InstanceTimeout()
+
+# Each solver gets the wall-clock deadline of the run, or None, so the time
+# spent loading the instance and building the planner counts against it.
+# They return the schedule, the status and the high-level and low-level
+# expansions; solvers without a high level return None for the former.
+
+def solve_cbs(param, deadline):
+    env = Environment(param["map"]["dimensions"], param["agents"], param["map"]["obstacles"])
+    time_limit = None if deadline is None else max(deadline - time.time(), 0.)
+    profiler = SearchProfiler()
+    result = CBS(env, time_limit=time_limit, profiler=profiler).search()
+    low_level_expanded = sum(result.profile.get('low_level_expanded', {}).values()) + \
+        sum(result.profile.get('joint_low_level_expanded', {}).values())
+    return result.plan, result.status, result.stats['expanded'], low_level_expanded
+
+def solve_coop(param, deadline):
+    ca = Coop_Astar(param["map"]["dimensions"], param["agents"], param["map"]["obstacles"])
+    ca.deadline = deadline
+    plan = ca.compute_solution()
+    if plan:
+        return plan, 'solved', None, ca.expanded
+    if deadline is not None and time.time() >= deadline:
+        return {}, 'time limit', None, ca.expanded
+    return {}, 'no solution', None, ca.expanded
+
+def solve_sipp(param, deadline):
+    sipp_planner = SippPlanner(param, 0)
+    sipp_planner.verbose = False
+    schedule = {}
+    expanded = 0
+    for i in range(len(param["agents"])):
+        if deadline is not None and time.time() >= deadline:
+            return {}, 'time limit', None, expanded
+        sipp_planner.set_agent(i)
+        found = sipp_planner.compute_plan()
+        expanded += sipp_planner.expanded
+        if not found:
+            return {}, 'no solution', None, expanded
+        plan = sipp_planner.get_plan()
+        schedule.update(plan)
+        sipp_planner.add_dynamic_obstacle(sipp_planner.name, plan[sipp_planner.name])
+    return schedule, 'solved', None, expanded
+
+SOLVERS = {'cbs': solve_cbs, 'coop': solve_coop, 'sipp': solve_sipp}
+
+def set_memory_limit(memory_mb):
+    if memory_mb is None:
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def run_instance(instance, solver, timeout):
+    """
+    Runs in a worker process and always returns a result row
+    """
+    row = {'instance': instance, 'solver': solver, 'agents': '', 'success': False, 'status': '',
+           'runtime': '', 'high_level_expansions': '', 'low_level_expansions': '', 'makespan': '',
+           'sum_of_costs': ''}
+    start_time = time.time()
+    deadline = None
+    if timeout is not None:
+        deadline = start_time + timeout
+        signal.signal(signal.SIGALRM, raise_timeout)
+        # grace period for solvers that stop on their own at the deadline
+        signal.setitimer(signal.ITIMER_REAL, timeout + 1.)
+    try:
+        param = load_instance(instance)
+        row['agents'] = len(param["agents"])
+        schedule, status, high_level_expansions, low_level_expansions = SOLVERS[solver](param, deadline)
+        row['status'] = status
+        row['high_level_expansions'] = '' if high_level_expansions is None else high_level_expansions
+        row['low_level_expansions'] = '' if low_level_expansions is None else low_level_expansions
+        if schedule:
+            row['success'] = True
+            row['makespan'] = max([len(path) for path in schedule.values()]) - 1
+            row['sum_of_costs'] = sum([len(path) for path in schedule.values()])
+    except InstanceTimeout:
+        row['status'] = 'time limit'
+    except MemoryError:
+        row['status'] = 'memory limit'
+    except Exception as exc:
+        row['status'] = 'error: ' + type(exc).__name__
+    finally:
+        if timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    row['runtime'] = round(time.time() - start_time, 4)
+    return row
+
+def natural_key(path):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path)]
+
+def collect_instances(paths):
+    """
+    YAML files and compiled bundles, given directly or found in directories,
+    with every bundle expanded into its instances
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted([os.path.join(path, f) for f in os.listdir(path)
+                             if f.endswith('.yaml') or f.endswith(BUNDLE_EXTENSION)], key=natural_key)
+        else:
+            files.append(path)
+    return [instance for file_name in files for instance in list_instances(file_name)]
+
+def load_results(output):
+    if not os.path.exists(output):
+        return []
+    with open(output, 'r') as output_file:
+        if output.endswith('.csv'):
+            return list(csv.DictReader(output_file))
+        return [json.loads(line) for line in output_file if line.strip()]
+
+def append_result(output, row):
+    is_csv = output.endswith('.csv')
+    new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+    with open(output, 'a', newline='') as output_file:
+        if is_csv:
+            writer = csv.DictWriter(output_file, fieldnames=FIELDS)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+        else:
+            output_file.write(json.dumps(row) + '\n')
+
+def summarize(rows):
+    for solver in sorted(set([row['solver'] for row in rows])):
+        solver_rows = [row for row in rows if row['solver'] == solver]
+        solved = [row for row in solver_rows if str(row['success']) == 'True']
+        runtime = sum([float(row['runtime']) for row in solved])
+        print(solver + ': ' + str(len(solved)) + '/' + str(len(solver_rows)) + ' solved, ' + \
+            'mean runtime of solved: ' + str(round(runtime / max(len(solved), 1), 3)) + 's')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("instances", nargs='+', help="instance files or directories of instance files")
+    parser.add_argument("--solvers", nargs='+', default=['cbs'], choices=sorted(SOLVERS.keys()), help="solvers to run on every instance")
+    parser.add_argument("--output", default="results.csv", help="results file, .csv or JSON lines otherwise")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--timeout", type=float, default=60., help="time limit per instance in seconds")
+    parser.add_argument("--memory", type=int, default=None, help="memory limit per worker in MB")
+    args = parser.parse_args()
+
+    instances = collect_instances(args.instances)
+    rows = load_results(args.output)
+    done = set([(row['instance'], row['solver']) for row in rows])
+    jobs = [(instance, solver) for instance in instances for solver in args.solvers if (instance, solver) not in done]
+    print(str(len(done)) + ' results found, ' + str(len(jobs)) + ' runs left')
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=set_memory_limit, initargs=(args.memory,)) as pool:
+        futures = [pool.submit(run_instance, instance, solver, args.timeout) for instance, solver in jobs]
+        for future in as_completed(futures):
+            row = future.result()
+            append_result(args.output, row)
+            rows.append(row)
+            print(row['solver'], row['instance'], row['status'], row['runtime'])
+
+    summarize(rows)
+
+if __name__ == "__main__":
+    main()
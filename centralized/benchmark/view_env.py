@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-import yaml
+import sys
+sys.path.insert(0, '../')
 import matplotlib
 # matplotlib.use("Agg")
 from matplotlib.patches import Circle, Rectangle, Arrow
@@ -10,6 +11,7 @@ from matplotlib import animation
 import matplotlib.animation as manimation
 import argparse
 import math
+from utils.instance import load_instance
 
 Colors = ['orange', 'blue', 'green']
 
@@ -84,8 +86,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
 
-    with open(args.map) as map_file:
-        map = yaml.load(map_file, Loader=yaml.FullLoader)
+    map = load_instance(args.map)
 
     animation = Animation(map)
     animation.show()
@@ -3,6 +3,8 @@
 AStar search
 
 """
+from heapq import heappush, heappop
+from time import time as wall_clock
 
 class AStar():
     def __init__(self, env):
@@ -10,59 +12,163 @@ class AStar():
         self.admissible_heuristic = env.admissible_heuristic
         self.is_at_goal = env.is_at_goal
         self.get_neighbors = env.get_neighbors
+        # states expanded by the last search
+        self.expanded = 0
 
     def reconstruct_path(self, came_from, current):
         total_path = [current]
-        while current in came_from.keys():
-            current = came_from[current]
+        while current.key in came_from:
+            current = came_from[current.key]
             total_path.append(current)
         return total_path[::-1]
 
-    def search(self, agent_name):
+    def search(self, agent_name, conflict_table=None, time_horizon=None, deadline=None):
         """
-        low level search 
+        low level search, ties on f are broken towards fewer conflicts with
+        the paths of the conflict table, then towards deeper nodes. States
+        that cannot reach the goal by time_horizon are not generated, so
+        the search fails once none is left. The search also fails once the
+        deadline (wall-clock time) has passed.
         """
         initial_state = self.agent_dict[agent_name]["start"]
         step_cost = 1
-        
-        closed_set = set()
-        open_set = {initial_state}
 
+        closed_set = set()
         came_from = {}
 
-        g_score = {} 
-        g_score[initial_state] = 0
-
-        f_score = {} 
+        initial_key = initial_state.key
+        g_score = {initial_key: 0}
+        conflict_score = {initial_key: 0}
 
-        f_score[initial_state] = self.admissible_heuristic(initial_state, agent_name)
+        # open list entries: (f, conflicts, -g, insertion order, key, state)
+        # stale entries are skipped on pop
+        counter = 0
+        f_start = self.admissible_heuristic(initial_state, agent_name)
+        open_heap = [(f_start, 0, 0, counter, initial_key, initial_state)]
+        expanded = 0
 
-        while open_set:
-            temp_dict = {open_item:f_score.setdefault(open_item, float("inf")) for open_item in open_set}
-            current = min(temp_dict, key=temp_dict.get)
+        while open_heap:
+            _, conflicts, neg_g, _, current_key, current = heappop(open_heap)
+            if current_key in closed_set:
+                continue
 
             if self.is_at_goal(current, agent_name):
+                self.expanded = expanded
                 return self.reconstruct_path(came_from, current)
 
-            open_set -= {current}
-            closed_set |= {current}
+            closed_set.add(current_key)
+            expanded += 1
+            if deadline is not None and expanded % 1024 == 0 and wall_clock() >= deadline:
+                break
 
-            neighbor_list = self.get_neighbors(current)
-
-            for neighbor in neighbor_list:
-                if neighbor in closed_set:
+            tentative_g_score = -neg_g + step_cost
+            cell = current.location.key
+            for neighbor in self.get_neighbors(current):
+                neighbor_key = neighbor.key
+                if neighbor_key in closed_set:
                     continue
-                
-                tentative_g_score = g_score.setdefault(current, float("inf")) + step_cost
-
-                if neighbor not in open_set:
-                    open_set |= {neighbor}
-                elif tentative_g_score >= g_score.setdefault(neighbor, float("inf")):
+                f_score = tentative_g_score + self.admissible_heuristic(neighbor, agent_name)
+                if time_horizon is not None and f_score > time_horizon:
+                    continue
+                neighbor_conflicts = conflicts
+                if conflict_table is not None:
+                    neighbor_conflicts += conflict_table.count_conflicts(neighbor.time, cell, neighbor.location.key)
+                g = g_score.get(neighbor_key)
+                if g is not None and (tentative_g_score > g or
+                                      (tentative_g_score == g and neighbor_conflicts >= conflict_score[neighbor_key])):
                     continue
 
-                came_from[neighbor] = current
+                came_from[neighbor_key] = current
+                g_score[neighbor_key] = tentative_g_score
+                conflict_score[neighbor_key] = neighbor_conflicts
 
-                g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = g_score[neighbor] + self.admissible_heuristic(neighbor, agent_name)
+                counter += 1
+                heappush(open_heap, (f_score, neighbor_conflicts, -tentative_g_score, counter, neighbor_key, neighbor))
+        self.expanded = expanded
         return False
 
+    def is_stale(self, entry, best, closed_set):
+        g, conflicts, key = entry[2], entry[3], entry[4]
+        return key in closed_set or best[key] != (g, conflicts)
+
+    def focal_search(self, agent_name, w, conflict_table=None, time_horizon=None):
+        """
+        bounded-suboptimal low level search: among the open states with
+        f <= w * f_min, the one with the fewest conflicts with the other
+        agents' paths is expanded. Returns the path and f_min, a lower
+        bound on the cost of an optimal path, or (False, None). States that
+        cannot reach the goal by time_horizon are not generated.
+        """
+        initial_state = self.agent_dict[agent_name]["start"]
+        step_cost = 1
+
+        closed_set = set()
+        came_from = {}
+
+        # best (g, conflicts) of each state; a closed state reached with a
+        # better pair is reopened so that f_min stays a lower bound
+        initial_key = initial_state.key
+        best = {initial_key: (0, 0)}
+
+        # open and waiting entries: (f, insertion order, g, conflicts, key, state), waiting
+        # holds the open states outside the focal bound; focal entries: (conflicts, f, -g, entry)
+        counter = 0
+        f_start = self.admissible_heuristic(initial_state, agent_name)
+        entry = (f_start, counter, 0, 0, initial_key, initial_state)
+        open_heap = [entry]
+        focal_heap = [(0, f_start, 0, entry)]
+        waiting = []
+        bound = w * f_start
+        expanded = 0
+
+        while True:
+            while open_heap and self.is_stale(open_heap[0], best, closed_set):
+                heappop(open_heap)
+            if not open_heap:
+                break
+            f_min = open_heap[0][0]
+            if w * f_min > bound:
+                bound = w * f_min
+                while waiting and waiting[0][0] <= bound:
+                    entry = heappop(waiting)
+                    heappush(focal_heap, (entry[3], entry[0], -entry[2], entry))
+
+            entry = heappop(focal_heap)[-1]
+            if self.is_stale(entry, best, closed_set):
+                continue
+            _, _, g, conflicts, current_key, current = entry
+
+            if self.is_at_goal(current, agent_name):
+                self.expanded = expanded
+                return self.reconstruct_path(came_from, current), f_min
+
+            closed_set.add(current_key)
+            expanded += 1
+
+            tentative_g_score = g + step_cost
+            cell = current.location.key
+            for neighbor in self.get_neighbors(current):
+                neighbor_key = neighbor.key
+                f_score = tentative_g_score + self.admissible_heuristic(neighbor, agent_name)
+                if time_horizon is not None and f_score > time_horizon:
+                    continue
+                neighbor_conflicts = conflicts
+                if conflict_table is not None:
+                    neighbor_conflicts += conflict_table.count_conflicts(neighbor.time, cell, neighbor.location.key)
+                score = (tentative_g_score, neighbor_conflicts)
+                if neighbor_key in best and score >= best[neighbor_key]:
+                    continue
+
+                came_from[neighbor_key] = current
+                best[neighbor_key] = score
+                closed_set.discard(neighbor_key)
+
+                counter += 1
+                entry = (f_score, counter, tentative_g_score, neighbor_conflicts, neighbor_key, neighbor)
+                heappush(open_heap, entry)
+                if f_score <= bound:
+                    heappush(focal_heap, (neighbor_conflicts, f_score, -tentative_g_score, entry))
+                else:
+                    heappush(waiting, entry)
+        self.expanded = expanded
+        return False, None
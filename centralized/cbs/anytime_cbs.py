@@ -0,0 +1,226 @@
+"""
+
+Anytime CBS with a deadline and the best solution found so far
+
+A prioritized solution (SIPP, then Coop A*) is found first and replaced by
+every cheaper conflict-free node the CBS search generates. When the time
+limit passes, the best solution is returned with a lower bound on the
+optimal cost.
+
+"""
+import sys
+sys.path.insert(0, '../')
+import os
+# graph_generation is imported by the SIPP planner as a top-level module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sipp'))
+import argparse
+import random
+import time
+import yaml
+from heapq import heappop
+
+from cbs.cbs import Environment, CBS, SearchResult
+from coop_astar.coop_astar import Coop_Astar
+from sipp.sipp import SippPlanner
+from utils.instance import load_instance
+from utils.profiler import SearchProfiler
+
+class AnytimeCBS(CBS):
+    """
+    Deadline-aware CBS. A prioritized solution is found first, and every
+    conflict-free node the search generates that costs less replaces it;
+    nodes that cannot cost less are pruned. When the deadline passes,
+    the best solution is returned with the lowest cost of the open nodes
+    as lower bound on the optimum.
+    """
+    def __init__(self, environment, time_limit=None, max_expanded=None, profiler=None, prioritize_conflicts=False,
+                 avoid_conflicts=True, disjoint_splitting=False, heuristic_cache=None):
+        CBS.__init__(self, environment, max_expanded, time_limit, profiler, prioritize_conflicts, avoid_conflicts,
+                     disjoint_splitting)
+        self.heuristic_cache = heuristic_cache
+        # agent orders tried by the prioritized fallback
+        self.fallback_orderings = 32
+        # best conflict-free solution so far
+        self.incumbent_plan = None
+        self.incumbent_cost = None
+
+    def update_incumbent(self, plan, cost, source):
+        if self.incumbent_cost is not None and cost >= self.incumbent_cost:
+            return
+        self.incumbent_plan = plan
+        self.incumbent_cost = cost
+        if self.profiler is not None:
+            self.profiler.count('improvements')
+            self.profiler.event('incumbent', source=source, cost=cost)
+
+    def push(self, node, result):
+        if self.incumbent_cost is not None and node.cost >= self.incumbent_cost:
+            if self.profiler is not None:
+                self.profiler.count('pruned')
+            return
+        if not node.conflicts:
+            self.update_incumbent(self.generate_plan(node.get_solution()), node.cost, 'cbs')
+            return
+        CBS.push(self, node, result)
+
+    def compute_sipp_solution(self, order, deadline):
+        """
+        prioritized SIPP plan with the agents in the given order, or None
+        """
+        env = self.env
+        param = {"map": {"dimensions": env.dimension, "obstacles": env.obstacles}, "agents": order}
+        sipp_planner = SippPlanner(param, 0, self.heuristic_cache, env.grid_map)
+        sipp_planner.verbose = False
+        plan = {}
+        for i in range(len(order)):
+            if deadline is not None and time.time() >= deadline:
+                return None
+            sipp_planner.set_agent(i)
+            if not sipp_planner.compute_plan():
+                return None
+            agent_plan = sipp_planner.get_plan()
+            plan.update(agent_plan)
+            sipp_planner.add_dynamic_obstacle(sipp_planner.name, agent_plan[sipp_planner.name])
+        return plan
+
+    def compute_fallback(self, start_time):
+        """
+        Prioritized solution: SIPP with the agents in the input order, the
+        farthest from their goal first and then in random orders, or else
+        Coop A* in the first two orders, until the deadline
+        """
+        env = self.env
+        agents = env.agents
+        deadline = self.get_deadline(start_time)
+        farthest_first = sorted(agents, key=lambda agent:
+                                -env.heuristic_dict[agent['name']][agent['start'][0]][agent['start'][1]])
+        orders = [agents, farthest_first]
+        rng = random.Random(0)
+        while len(orders) < self.fallback_orderings:
+            order = list(agents)
+            rng.shuffle(order)
+            orders.append(order)
+
+        # SIPP fails an ordering much faster than Coop A*, which expands every wait
+        for order in orders:
+            if deadline is not None and time.time() >= deadline:
+                return
+            plan = self.compute_sipp_solution(order, deadline)
+            if plan:
+                self.update_incumbent(plan, env.compute_solution_cost(plan), 'sipp')
+                return
+
+        # a reachable goal is reached at most one timestep per free cell after the others stopped
+        time_horizon = int((~env.grid_map.grid).sum())
+        for order in orders[:2]:
+            if deadline is not None and time.time() >= deadline:
+                return
+            coop_astar = Coop_Astar(env.dimension, order, env.obstacles, self.heuristic_cache)
+            coop_astar.time_horizon = time_horizon
+            coop_astar.deadline = deadline
+            plan = coop_astar.compute_solution()
+            if plan:
+                self.update_incumbent(plan, coop_astar.compute_solution_cost(plan), 'coop_astar')
+                return
+
+    def search(self):
+        result = SearchResult()
+        start_time = time.time()
+        self.env.profiler = self.profiler
+        self.env.deadline = self.get_deadline(start_time)
+
+        if self.env.unreachable_agents:
+            return self.finish(result, start_time)
+        self.compute_fallback(start_time)
+        start = self.create_root()
+        if start is None:
+            return self.finish(result, start_time)
+        self.push(start, result)
+
+        while self.open_list:
+            # no open node can beat the incumbent, it is optimal
+            if self.incumbent_cost is not None and self.open_list[0][0] >= self.incumbent_cost:
+                self.open_list = []
+                break
+            if self.limit_reached(result, start_time):
+                break
+
+            P = heappop(self.open_list)[-1]
+            result.stats['expanded'] += 1
+            if self.profiler is not None:
+                self.profiler.event('expand', cost=P.cost, conflicts=len(P.conflicts))
+
+            solution = P.get_solution()
+            conflict = self.select_conflict(P, solution)
+            for new_node, replanned in self.create_children(P, conflict):
+                child_solution = self.replan(new_node, solution, replanned)
+                if child_solution is not None:
+                    self.add_child(P, solution, new_node, child_solution, result)
+
+        if self.incumbent_plan is not None:
+            result.status = SearchResult.SOLVED
+            result.plan = self.incumbent_plan
+            result.cost = self.incumbent_cost
+            result.stats['lower_bound'] = min(self.open_list[0][0], self.incumbent_cost) \
+                if self.open_list else self.incumbent_cost
+        return self.finish(result, start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--heuristic-cache", default=None, help="directory to persist distance-to-goal tables in")
+    parser.add_argument("--max-nodes", type=int, default=None, help="maximum number of high-level nodes to expand")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="deadline in seconds, the best solution found by then is returned")
+    parser.add_argument("--icbs", action='store_true', help="split on cardinal conflicts first (Improved CBS)")
+    parser.add_argument("--disjoint-splitting", action='store_true',
+                        help="split conflicts with a positive and a negative constraint on one agent")
+    parser.add_argument("--no-conflict-avoidance", action='store_true',
+                        help="do not break low level ties towards fewer conflicts with the other agents")
+    parser.add_argument("--sipp", action='store_true',
+                        help="plan single agents on safe intervals (SIPP) instead of timesteps")
+    parser.add_argument("--profile", action='store_true', help="print search counters and section times")
+    parser.add_argument("--trace", default=None, help="file to stream search events to, as JSON lines")
+    args = parser.parse_args()
+
+    # Read from input file
+    try:
+        param = load_instance(args.param)
+    except yaml.YAMLError as exc:
+        print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache, args.sipp)
+
+    # Searching
+    profiler = None
+    trace_file = open(args.trace, 'w') if args.trace else None
+    if args.profile or trace_file:
+        profiler = SearchProfiler(trace_file)
+    cbs = AnytimeCBS(env, args.time_limit, args.max_nodes, profiler, args.icbs, not args.no_conflict_avoidance,
+                     args.disjoint_splitting, args.heuristic_cache)
+    result = cbs.search()
+    if trace_file:
+        trace_file.close()
+    print(result)
+    if args.profile:
+        print(profiler)
+    if not result:
+        print(" Solution not found" )
+        return
+
+    # Write to output file
+    output = dict()
+    output["schedule"] = result.plan
+    output["cost"] = result.cost
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
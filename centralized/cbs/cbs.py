@@ -8,38 +8,29 @@ author: Ashwin Bose (@atb033)
 import sys
 sys.path.insert(0, '../')
 import argparse
+import time
 import yaml
-from math import fabs
-from itertools import combinations
-from copy import deepcopy
+from heapq import heappush, heappop
+from bisect import bisect_left
+from time import perf_counter
 
 from cbs.a_star import AStar
-
-class Location(object):
-    def __init__(self, x=-1, y=-1):
-        self.x = x
-        self.y = y
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
-    def __str__(self):
-        return str((self.x, self.y))
-
-class State(object):
-    def __init__(self, time, location):
-        self.time = time
-        self.location = location
-    def __eq__(self, other):
-        return self.time == other.time and self.location == other.location
-    def __hash__(self):
-        return hash(str(self.time)+str(self.location.x) + str(self.location.y))
-    def is_equal_except_time(self, state):
-        return self.location == state.location
-    def __str__(self):
-        return str((self.time, self.location.x, self.location.y))
+from cbs.joint_a_star import JointAStar
+from cbs.mdd import MDD
+from cbs.safe_interval import SafeIntervalSearch
+from utils.grid_map import GridMap
+from utils.heuristic import DistanceTable
+from utils.instance import load_instance
+from utils.profiler import SearchProfiler
+from utils.state import Location, State, state_key, edge_key, move_key
 
 class Conflict(object):
     VERTEX = 1
     EDGE = 2
+
+    CARDINAL = 'cardinal'
+    SEMI_CARDINAL = 'semi-cardinal'
+    NON_CARDINAL = 'non-cardinal'
     def __init__(self):
         self.time = -1
         self.type = -1
@@ -55,27 +46,30 @@ class Conflict(object):
              ', '+ str(self.location_1) + ', ' + str(self.location_2) + ')'
 
 class VertexConstraint(object):
+    __slots__ = ('time', 'location', 'key')
     def __init__(self, time, location):
         self.time = time
         self.location = location
+        self.key = state_key(time, location.key)
 
     def __eq__(self, other):
-        return self.time == other.time and self.location == other.location
+        return self.key == other.key
     def __hash__(self):
-        return hash(str(self.time)+str(self.location))
+        return self.key
     def __str__(self):
         return '(' + str(self.time) + ', '+ str(self.location) + ')'
 
 class EdgeConstraint(object):
+    __slots__ = ('time', 'location_1', 'location_2', 'key')
     def __init__(self, time, location_1, location_2):
         self.time = time
         self.location_1 = location_1
         self.location_2 = location_2
+        self.key = edge_key(time, location_1.key, location_2.key)
     def __eq__(self, other):
-        return self.time == other.time and self.location_1 == other.location_1 \
-            and self.location_2 == other.location_2
+        return self.key == other.key
     def __hash__(self):
-        return hash(str(self.time) + str(self.location_1) + str(self.location_2))
+        return self.key
     def __str__(self):
         return '(' + str(self.time) + ', '+ str(self.location_1) +', '+ str(self.location_2) + ')'
 
@@ -83,87 +77,319 @@ class Constraints(object):
     def __init__(self):
         self.vertex_constraints = set()
         self.edge_constraints = set()
+        # positive constraints: the agent must be at the location (or make the move) at that time
+        self.positive_vertex_constraints = set()
+        self.positive_edge_constraints = set()
 
     def add_constraint(self, other):
         self.vertex_constraints |= other.vertex_constraints
         self.edge_constraints |= other.edge_constraints
+        self.positive_vertex_constraints |= other.positive_vertex_constraints
+        self.positive_edge_constraints |= other.positive_edge_constraints
+
+    def has_positive_constraints(self):
+        return bool(self.positive_vertex_constraints or self.positive_edge_constraints)
+
+    def get_implied_constraints(self):
+        """
+        negative constraints that the positive ones impose on every other agent
+        """
+        implied = Constraints()
+        implied.vertex_constraints |= self.positive_vertex_constraints
+        for ec in self.positive_edge_constraints:
+            implied.vertex_constraints.add(VertexConstraint(ec.time, ec.location_1))
+            implied.vertex_constraints.add(VertexConstraint(ec.time + 1, ec.location_2))
+            implied.edge_constraints.add(EdgeConstraint(ec.time, ec.location_2, ec.location_1))
+        return implied
 
     def __str__(self):
         return "VC: " + str([str(vc) for vc in self.vertex_constraints])  + \
-            "EC: " + str([str(ec) for ec in self.edge_constraints])
+            "EC: " + str([str(ec) for ec in self.edge_constraints]) + \
+            "PVC: " + str([str(vc) for vc in self.positive_vertex_constraints]) + \
+            "PEC: " + str([str(ec) for ec in self.positive_edge_constraints])
+
+class ConstraintTable(object):
+    """
+    Constraints of one agent compiled by timestep: the cells and moves
+    forbidden at each time, the latest constrained time of each cell and
+    the landmarks (time -> location) set by positive constraints
+    """
+    def __init__(self, constraints=None):
+        self.vertex_table = {}
+        self.edge_table = {}
+        self.latest_time = {}
+        self.landmarks = {}
+        self.landmark_times = []
+        self.last_landmark = None
+        # goal cell -> last landmark away from that goal
+        self.goal_landmarks = {}
+        # last timestep with a constraint, the agent moves freely afterwards
+        self.max_time = -1
+        if constraints is not None:
+            self.add_constraint(constraints)
+
+    def add_constraint(self, constraints):
+        for vc in constraints.vertex_constraints:
+            self.vertex_table.setdefault(vc.time, set()).add(vc.location.key)
+            self.latest_time[vc.location.key] = max(vc.time, self.latest_time.get(vc.location.key, -1))
+            self.max_time = max(self.max_time, vc.time)
+        for ec in constraints.edge_constraints:
+            self.edge_table.setdefault(ec.time, set()).add(move_key(ec.location_1.key, ec.location_2.key))
+            self.max_time = max(self.max_time, ec.time + 1)
+        for vc in constraints.positive_vertex_constraints:
+            self.landmarks[vc.time] = vc.location
+        for ec in constraints.positive_edge_constraints:
+            self.landmarks[ec.time] = ec.location_1
+            self.landmarks[ec.time + 1] = ec.location_2
+        if self.landmarks:
+            self.landmark_times = sorted(self.landmarks.keys())
+            self.last_landmark = (self.landmark_times[-1], self.landmarks[self.landmark_times[-1]])
+            self.max_time = max(self.max_time, self.last_landmark[0])
+            self.goal_landmarks = {}
+
+    def is_vertex_constrained(self, time, cell):
+        cells = self.vertex_table.get(time)
+        return cells is not None and cell in cells
+
+    def is_edge_constrained(self, time, cell_1, cell_2):
+        moves = self.edge_table.get(time)
+        return moves is not None and move_key(cell_1, cell_2) in moves
+
+    def get_latest_time(self, cell):
+        return self.latest_time.get(cell, -1)
+
+    def get_landmark(self, time):
+        return self.landmarks.get(time)
+
+    def get_last_landmark(self, goal):
+        """
+        last landmark away from the goal cell, as (time, location), or None;
+        an agent meets the later ones by staying at its goal
+        """
+        if goal in self.goal_landmarks:
+            return self.goal_landmarks[goal]
+        last = None
+        for time in reversed(self.landmark_times):
+            if self.landmarks[time].key != goal:
+                last = (time, self.landmarks[time])
+                break
+        self.goal_landmarks[goal] = last
+        return last
+
+    def get_next_landmark(self, time):
+        """
+        first landmark at or after time, as (time, location), or None
+        """
+        i = bisect_left(self.landmark_times, time)
+        if i == len(self.landmark_times):
+            return None
+        return self.landmark_times[i], self.landmarks[self.landmark_times[i]]
+
+class ConflictAvoidanceTable(object):
+    """
+    Paths of the other agents hashed by timestep, to count the conflicts
+    of a move with them. Agents stay at their goal once their path ends.
+    """
+    def __init__(self, solution=None, excluded_agent=None):
+        self.vertex_table = {}
+        self.edge_table = {}
+        # cell -> times from which agents wait there
+        self.goal_table = {}
+        # last timestep of a path, the counts do not change afterwards
+        self.max_time = -1
+        if solution is not None:
+            for agent, path in solution.items():
+                if agent != excluded_agent:
+                    self.add_path(path)
+
+    def add_path(self, path):
+        for state in path:
+            self.vertex_table[state.key] = self.vertex_table.get(state.key, 0) + 1
+        for state_1, state_2 in zip(path, path[1:]):
+            if state_1.location.key != state_2.location.key:
+                key = edge_key(state_1.time, state_1.location.key, state_2.location.key)
+                self.edge_table[key] = self.edge_table.get(key, 0) + 1
+        self.goal_table.setdefault(path[-1].location.key, []).append(len(path))
+        self.max_time = max(self.max_time, len(path) - 1)
+
+    def count_conflicts(self, time, cell_1, cell_2):
+        """
+        conflicts of a move from cell_1 at time - 1 to cell_2 at time
+        """
+        count = self.vertex_table.get(state_key(time, cell_2), 0)
+        waiting = self.goal_table.get(cell_2)
+        if waiting is not None:
+            count += len([t for t in waiting if t <= time])
+        if cell_1 != cell_2:
+            count += self.edge_table.get(edge_key(time - 1, cell_2, cell_1), 0)
+        return count
 
 class Environment(object):
-    def __init__(self, dimension, agents, obstacles):
+    def __init__(self, dimension, agents, obstacles, heuristic_cache=None, sipp=False):
         self.dimension = dimension
         self.obstacles = obstacles
+        self.grid_map = GridMap(dimension, obstacles)
+        self.distance_table = DistanceTable(self.grid_map, heuristic_cache)
 
         self.agents = agents
         self.agent_dict = {}
+        self.heuristic_dict = {}
+        # distance from each goal to the farthest cell it can be reached from
+        self.goal_eccentricity = {}
+        # agents whose goal is not connected to their start on the static map
+        self.unreachable_agents = set()
 
         self.make_agent_dict()
 
-        self.constraints = Constraints()
+        self.constraints = ConstraintTable()
         self.constraint_dict = {}
 
         self.a_star = AStar(self)
+        self.joint_a_star = JointAStar(self)
+        # optimal single-agent searches run on safe intervals with sipp
+        self.sipp = sipp
+        self.low_level = SafeIntervalSearch(self) if sipp else self.a_star
+        self.profiler = None
+        # wall-clock time at which joint searches give up, set by the high level
+        self.deadline = None
+        # distances to landmark cells, by cell
+        self.landmark_heuristics = {}
 
     def get_neighbors(self, state):
         neighbors = []
-
-        # Wait action
-        n = State(state.time + 1, state.location)
-        if self.state_valid(n):
-            neighbors.append(n)
-        # Up action
-        n = State(state.time + 1, Location(state.location.x, state.location.y+1))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
-        # Down action
-        n = State(state.time + 1, Location(state.location.x, state.location.y-1))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
-        # Left action
-        n = State(state.time + 1, Location(state.location.x-1, state.location.y))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
-        # Right action
-        n = State(state.time + 1, Location(state.location.x+1, state.location.y))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
+        time = state.time + 1
+        cell = state.location.key
+        # with positive constraints, the next landmark must stay reachable in time
+        landmark = self.constraints.get_next_landmark(time) if self.constraints.landmarks else None
+        if landmark is not None:
+            distances = self.get_landmark_heuristic(landmark[1])
+        # wait, up, down, left and right moves into free cells come from the map
+        for location in self.grid_map.get_moves(state.location):
+            if self.constraints.is_vertex_constrained(time, location.key):
+                continue
+            if location.key != cell and self.constraints.is_edge_constrained(state.time, cell, location.key):
+                continue
+            if landmark is not None and distances[location.x][location.y] > landmark[0] - time:
+                continue
+            neighbors.append(State(time, location))
         return neighbors
 
+    def get_landmark_heuristic(self, location):
+        heuristic = self.landmark_heuristics.get(location.key)
+        if heuristic is None:
+            heuristic = self.distance_table.get_heuristic((location.x, location.y))
+            self.landmark_heuristics[location.key] = heuristic
+        return heuristic
 
     def get_first_conflict(self, solution):
+        conflicts = self.get_all_conflicts(solution, first_only=True)
+        if not conflicts:
+            return False
+        return conflicts[0]
+
+    def count_conflicts(self, solution):
+        return len(self.get_all_conflicts(solution))
+
+    def get_all_conflicts(self, solution, first_only=False):
+        """
+        Conflicts ordered by time, vertex conflicts before edge conflicts.
+        Each timestep hashes occupied cells (cell -> agents) and traversed
+        edges (edge -> agents), so a solution is scanned in O(N*T) plus one
+        conflict per pair of agents sharing a cell or an edge.
+        """
+        agents = list(solution.keys())
+        paths = list(solution.values())
+        max_t = max([len(plan) for plan in paths])
+        conflicts = []
+        for t in range(max_t):
+            occupied = {}
+            for i, path in enumerate(paths):
+                location = path[t].location if t < len(path) else path[-1].location
+                others = occupied.setdefault(location.key, [])
+                for other in others:
+                    conflict = Conflict()
+                    conflict.time = t
+                    conflict.type = Conflict.VERTEX
+                    conflict.location_1 = location
+                    conflict.agent_1 = agents[other]
+                    conflict.agent_2 = agents[i]
+                    conflicts.append(conflict)
+                others.append(i)
+            if first_only and conflicts:
+                return conflicts
+
+            traversed = {}
+            for i, path in enumerate(paths):
+                if t + 1 >= len(path):
+                    continue
+                location_a = path[t].location
+                location_b = path[t+1].location
+                if location_a.key == location_b.key:
+                    continue
+                for other in traversed.get(edge_key(t, location_b.key, location_a.key), ()):
+                    conflict = Conflict()
+                    conflict.time = t
+                    conflict.type = Conflict.EDGE
+                    conflict.agent_1 = agents[other]
+                    conflict.agent_2 = agents[i]
+                    conflict.location_1 = location_b
+                    conflict.location_2 = location_a
+                    conflicts.append(conflict)
+                traversed.setdefault(edge_key(t, location_a.key, location_b.key), []).append(i)
+            if first_only and conflicts:
+                return conflicts
+        return conflicts
+
+    def get_agent_conflicts(self, solution, agent):
+        """
+        Conflicts between the path of one agent and every other path, used to
+        patch a node's conflicts after only that agent was replanned.
+        """
+        path = solution[agent]
+        others = [(name, plan) for name, plan in solution.items() if name != agent]
         max_t = max([len(plan) for plan in solution.values()])
-        result = Conflict()
+        conflicts = []
         for t in range(max_t):
-            for agent_1, agent_2 in combinations(solution.keys(), 2):
-                state_1 = self.get_state(agent_1, solution, t)
-                state_2 = self.get_state(agent_2, solution, t)
-                if state_1.is_equal_except_time(state_2):
-                    result.time = t
-                    result.type = Conflict.VERTEX
-                    result.location_1 = state_1.location
-                    result.agent_1 = agent_1
-                    result.agent_2 = agent_2
-                    return result
-
-            for agent_1, agent_2 in combinations(solution.keys(), 2):
-                state_1a = self.get_state(agent_1, solution, t)
-                state_1b = self.get_state(agent_1, solution, t+1)
-
-                state_2a = self.get_state(agent_2, solution, t)
-                state_2b = self.get_state(agent_2, solution, t+1)
-
-                if state_1a.is_equal_except_time(state_2b) and state_1b.is_equal_except_time(state_2a):
-                    result.time = t
-                    result.type = Conflict.EDGE
-                    result.agent_1 = agent_1
-                    result.agent_2 = agent_2
-                    result.location_1 = state_1a.location
-                    result.location_2 = state_1b.location
-                    return result
-        return False
+            location = path[t].location if t < len(path) else path[-1].location
+            for name, plan in others:
+                other_location = plan[t].location if t < len(plan) else plan[-1].location
+                if location.key == other_location.key:
+                    conflict = Conflict()
+                    conflict.time = t
+                    conflict.type = Conflict.VERTEX
+                    conflict.location_1 = location
+                    conflict.agent_1 = agent
+                    conflict.agent_2 = name
+                    conflicts.append(conflict)
+
+            if t + 1 >= len(path):
+                continue
+            next_location = path[t+1].location
+            if location.key == next_location.key:
+                continue
+            for name, plan in others:
+                if t + 1 >= len(plan):
+                    continue
+                if plan[t].location.key == next_location.key and plan[t+1].location.key == location.key:
+                    conflict = Conflict()
+                    conflict.time = t
+                    conflict.type = Conflict.EDGE
+                    conflict.agent_1 = agent
+                    conflict.agent_2 = name
+                    conflict.location_1 = location
+                    conflict.location_2 = next_location
+                    conflicts.append(conflict)
+        return conflicts
+
+    def patch_conflicts(self, conflicts, solution, agent):
+        """
+        Replaces the conflicts involving a replanned agent, keeping the
+        (time, vertex before edge) order of get_all_conflicts
+        """
+        patched = [c for c in conflicts if c.agent_1 != agent and c.agent_2 != agent]
+        patched += self.get_agent_conflicts(solution, agent)
+        patched.sort(key=lambda c: (c.time, c.type))
+        return patched
 
     def create_constraints_from_conflict(self, conflict):
         constraint_dict = {}
@@ -189,6 +415,59 @@ class Environment(object):
 
         return constraint_dict
 
+    def create_disjoint_constraints(self, conflict):
+        """
+        disjoint splitting: agent_1 must be where the conflict happens in
+        one child, which forbids it to every other agent, and must not be
+        there in the other
+        """
+        positive = Constraints()
+        negative = Constraints()
+        if conflict.type == Conflict.VERTEX:
+            positive.positive_vertex_constraints.add(VertexConstraint(conflict.time, conflict.location_1))
+            negative.vertex_constraints.add(VertexConstraint(conflict.time, conflict.location_1))
+        elif conflict.type == Conflict.EDGE:
+            positive.positive_edge_constraints.add(EdgeConstraint(conflict.time, conflict.location_1, conflict.location_2))
+            negative.edge_constraints.add(EdgeConstraint(conflict.time, conflict.location_1, conflict.location_2))
+        return [{conflict.agent_1: positive}, {conflict.agent_1: negative}]
+
+    def path_violates(self, path, constraints):
+        last = len(path) - 1
+        for vc in constraints.vertex_constraints:
+            if path[min(vc.time, last)].location.key == vc.location.key:
+                return True
+        for ec in constraints.edge_constraints:
+            if ec.time < last and path[ec.time].location.key == ec.location_1.key \
+                    and path[ec.time + 1].location.key == ec.location_2.key:
+                return True
+        for vc in constraints.positive_vertex_constraints:
+            if path[min(vc.time, last)].location.key != vc.location.key:
+                return True
+        for ec in constraints.positive_edge_constraints:
+            if path[min(ec.time, last)].location.key != ec.location_1.key \
+                    or path[min(ec.time + 1, last)].location.key != ec.location_2.key:
+                return True
+        return False
+
+    def get_violating_agents(self, solution, constraint_dict):
+        """
+        agents whose path breaks new constraints, their own or the ones
+        implied by another agent's positive constraints
+        """
+        implied = {agent: constraints.get_implied_constraints() for agent, constraints in constraint_dict.items()
+                   if constraints.has_positive_constraints()}
+        agents = []
+        for agent, path in solution.items():
+            constraints = Constraints()
+            if agent in constraint_dict:
+                constraints.add_constraint(constraint_dict[agent])
+            for other, other_constraints in implied.items():
+                if other != agent:
+                    constraints.add_constraint(other_constraints)
+            if self.path_violates(path, constraints):
+                agents.append(agent)
+        return agents
+
     def get_state(self, agent_name, solution, t):
         if t < len(solution[agent_name]):
             return solution[agent_name][t]
@@ -196,25 +475,35 @@ class Environment(object):
             return solution[agent_name][-1]
 
     def state_valid(self, state):
-        return state.location.x >= 0 and state.location.x < self.dimension[0] \
-            and state.location.y >= 0 and state.location.y < self.dimension[1] \
-            and VertexConstraint(state.time, state.location) not in self.constraints.vertex_constraints \
-            and (state.location.x, state.location.y) not in self.obstacles
+        location = state.location
+        return self.grid_map.is_free(location.x, location.y) \
+            and not self.constraints.is_vertex_constrained(state.time, location.key)
 
     def transition_valid(self, state_1, state_2):
-        return EdgeConstraint(state_1.time, state_1.location, state_2.location) not in self.constraints.edge_constraints
+        return not self.constraints.is_edge_constrained(state_1.time, state_1.location.key, state_2.location.key)
 
     def is_solution(self, agent_name):
         pass
 
     def admissible_heuristic(self, state, agent_name):
-        goal = self.agent_dict[agent_name]["goal"]
-        return fabs(state.location.x - goal.location.x) + fabs(state.location.y - goal.location.y)
+        heuristic = self.heuristic_dict[agent_name]
+        h = heuristic[state.location.x][state.location.y]
+        last = self.constraints.get_last_landmark(self.agent_dict[agent_name]["goal"].location.key) \
+            if self.constraints.landmarks else None
+        if last is not None and state.time < last[0]:
+            # the agent is at its last landmark at that time, and goes to its goal from there
+            h = max(h, last[0] - state.time + heuristic[last[1].x][last[1].y])
+        return h
 
 
     def is_at_goal(self, state, agent_name):
         goal_state = self.agent_dict[agent_name]["goal"]
-        return state.is_equal_except_time(goal_state)
+        last = self.constraints.get_last_landmark(goal_state.location.key) if self.constraints.landmarks else None
+        # the agent stays at its goal, so it must not be constrained there later on,
+        # and only its landmarks away from the goal are still ahead of it
+        return state.is_equal_except_time(goal_state) \
+            and state.time > self.constraints.get_latest_time(goal_state.location.key) \
+            and (last is None or state.time >= last[0])
 
     def make_agent_dict(self):
         for agent in self.agents:
@@ -222,83 +511,467 @@ class Environment(object):
             goal_state = State(0, Location(agent['goal'][0], agent['goal'][1]))
 
             self.agent_dict.update({agent['name']:{'start':start_state, 'goal':goal_state}})
-
-    def compute_solution(self):
+            self.heuristic_dict[agent['name']] = self.distance_table.get_heuristic(agent['goal'])
+            self.goal_eccentricity[agent['name']] = int(self.distance_table.get_distances(agent['goal']).max())
+            if not self.grid_map.is_connected(agent['start'], agent['goal']):
+                self.unreachable_agents.add(agent['name'])
+
+    def get_time_horizon(self, agent):
+        """
+        latest arrival time of an optimal path under the agent's current
+        constraints: after the last constrained timestep the goal is at
+        most its eccentricity away
+        """
+        return self.constraints.max_time + 1 + self.goal_eccentricity[agent]
+
+    def compute_agent_solution(self, agent, conflict_table=None):
+        if agent in self.unreachable_agents:
+            return False
+        self.constraints = self.constraint_dict.setdefault(agent, ConstraintTable())
+        time_horizon = self.get_time_horizon(agent)
+        if self.profiler is None:
+            return self.low_level.search(agent, conflict_table, time_horizon)
+        start = perf_counter()
+        path = self.low_level.search(agent, conflict_table, time_horizon)
+        self.profiler.add_time('low_level', start)
+        self.profiler.count('low_level_searches')
+        self.profiler.count_agent('low_level_expanded', agent, self.low_level.expanded)
+        return path
+
+    def compute_meta_agent_solution(self, agents, conflict_table=None):
+        """
+        paths of a group of agents planned jointly, by agent, each one
+        under its own constraints
+        """
+        constraint_tables = [self.constraint_dict.setdefault(agent, ConstraintTable()) for agent in agents]
+        if self.profiler is None:
+            return self.joint_a_star.search(agents, constraint_tables, conflict_table, self.deadline)
+        start = perf_counter()
+        paths = self.joint_a_star.search(agents, constraint_tables, conflict_table, self.deadline)
+        self.profiler.add_time('joint_low_level', start)
+        self.profiler.count('joint_low_level_searches')
+        self.profiler.count_agent('joint_low_level_expanded', ' '.join(agents), self.joint_a_star.expanded)
+        return paths
+
+    def compute_group_solution(self, group, conflict_table=None):
+        """
+        paths of a meta-agent by agent, a single agent is planned alone
+        """
+        if len(group) == 1:
+            path = self.compute_agent_solution(group[0], conflict_table)
+            return {group[0]: path} if path else False
+        return self.compute_meta_agent_solution(group, conflict_table)
+
+    def compute_agent_focal_solution(self, agent, w, conflict_table=None):
+        """
+        path within w of the optimal cost, and a lower bound on the number
+        of states of an optimal path
+        """
+        if agent in self.unreachable_agents:
+            return False, None
+        self.constraints = self.constraint_dict.setdefault(agent, ConstraintTable())
+        if self.profiler is not None:
+            start = perf_counter()
+        path, f_min = self.a_star.focal_search(agent, w, conflict_table, self.get_time_horizon(agent))
+        if self.profiler is not None:
+            self.profiler.add_time('low_level', start)
+            self.profiler.count('low_level_searches')
+            self.profiler.count_agent('low_level_expanded', agent, self.a_star.expanded)
+        if not path:
+            return False, None
+        return path, f_min + 1
+
+    def compute_solution(self, avoid_conflicts=False):
+        """
+        with avoid_conflicts, each agent breaks ties away from the paths
+        planned before its own
+        """
         solution = {}
+        conflict_table = ConflictAvoidanceTable() if avoid_conflicts else None
         for agent in self.agent_dict.keys():
-            self.constraints = self.constraint_dict.setdefault(agent, Constraints())
-            local_solution = self.a_star.search(agent)
+            local_solution = self.compute_agent_solution(agent, conflict_table)
             if not local_solution:
                 return False
             solution.update({agent:local_solution})
+            if conflict_table is not None:
+                conflict_table.add_path(local_solution)
         return solution
 
     def compute_solution_cost(self, solution):
         return sum([len(path) for path in solution.values()])
 
 class HighLevelNode(object):
-    def __init__(self):
-        self.solution = {}
-        self.constraint_dict = {}
+    """
+    A node only stores its parent, its new constraints by agent and the
+    paths of the agents it replanned. Solutions and constraints are rebuilt
+    from the chain of ancestors; the root holds the full initial solution.
+    """
+    def __init__(self, parent=None, constraints=None):
+        self.parent = parent
+        self.constraints = constraints if constraints is not None else {}
+        self.paths = {}
+        # agent -> its meta-agent, a sorted tuple of agents; shared with the parent until a merge
+        self.groups = parent.groups if parent is not None else {}
+        self.conflicts = []
         self.cost = 0
+        # MDDs of the agents whose path or constraints this node set, built on demand
+        self.mdds = None
 
-    def __eq__(self, other):
-        if not isinstance(other, type(self)): return NotImplemented
-        return self.solution == other.solution and self.cost == other.cost
-
-    def __hash__(self):
-        return hash((self.cost))
-
-    def __lt__(self, other):
-        return self.cost < other.cost
-
-class CBS(object):
-    def __init__(self, environment):
-        self.env = environment
-        self.open_set = set()
-        self.closed_set = set()
-    def search(self):
-        start = HighLevelNode()
-        # TODO: Initialize it in a better way
-        start.constraint_dict = {}
-        for agent in self.env.agent_dict.keys():
-            start.constraint_dict[agent] = Constraints()
-        start.solution = self.env.compute_solution()
-        if not start.solution:
-            return {}
-        start.cost = self.env.compute_solution_cost(start.solution)
-
-        self.open_set |= {start}
+    def get_solution(self):
+        solution = {}
+        node = self
+        while node is not None:
+            for agent, path in node.paths.items():
+                solution.setdefault(agent, path)
+            node = node.parent
+        return solution
 
-        while self.open_set:
-            P = min(self.open_set)
-            self.open_set -= {P}
-            self.closed_set |= {P}
+    def get_constraints(self, agent):
+        constraints = Constraints()
+        node = self
+        while node.parent is not None:
+            for other, other_constraints in node.constraints.items():
+                if other == agent:
+                    constraints.add_constraint(other_constraints)
+                elif other_constraints.has_positive_constraints():
+                    constraints.add_constraint(other_constraints.get_implied_constraints())
+            node = node.parent
+        return constraints
+
+    def get_path_owner(self, agent):
+        """
+        closest ancestor that set the agent's path; the agent's path is the
+        same in all of its descendants
+        """
+        node = self
+        while agent not in node.paths:
+            node = node.parent
+        return node
+
+    def constrains(self, agent):
+        """
+        whether the node adds constraints to the agent, its own or the ones
+        implied by another agent's positive constraints
+        """
+        for other, constraints in self.constraints.items():
+            if other == agent or constraints.has_positive_constraints():
+                return True
+        return False
 
-            self.env.constraint_dict = P.constraint_dict
-            conflict_dict = self.env.get_first_conflict(P.solution)
-            if not conflict_dict:
-                print("solution found")
+    def get_constraint_owner(self, agent):
+        """
+        closest ancestor that set the agent's path or changed its
+        constraints. With disjoint splitting, a node can constrain an agent
+        without replanning it, so its constraints are only the same in the
+        descendants of this node.
+        """
+        node = self
+        while agent not in node.paths and not node.constrains(agent):
+            node = node.parent
+        return node
+
+class SearchResult(object):
+    SOLVED = 'solved'
+    NO_SOLUTION = 'no solution'
+    NODE_LIMIT = 'node limit'
+    TIME_LIMIT = 'time limit'
+    def __init__(self):
+        self.status = SearchResult.NO_SOLUTION
+        self.plan = {}
+        self.cost = -1
+        self.stats = {'expanded': 0, 'generated': 0, 'runtime': 0.}
+        # counters and section times, only filled in when profiling
+        self.profile = {}
 
-                return self.generate_plan(P.solution)
+    def __bool__(self):
+        return self.status == SearchResult.SOLVED
 
-            constraint_dict = self.env.create_constraints_from_conflict(conflict_dict)
+    def __str__(self):
+        return self.status + ', cost: ' + str(self.cost) + ', ' + \
+            ', '.join([key + ': ' + str(value) for key, value in self.stats.items()])
 
-            for agent in constraint_dict.keys():
-                new_node = deepcopy(P)
-                new_node.constraint_dict[agent].add_constraint(constraint_dict[agent])
+class CBS(object):
+    # type of the high-level nodes the search creates
+    node_type = HighLevelNode
 
-                self.env.constraint_dict = new_node.constraint_dict
-                new_node.solution = self.env.compute_solution()
-                if not new_node.solution:
-                    continue
-                new_node.cost = self.env.compute_solution_cost(new_node.solution)
+    def __init__(self, environment, max_expanded=None, time_limit=None, profiler=None, prioritize_conflicts=False,
+                 avoid_conflicts=True, disjoint_splitting=False, merge_threshold=None, max_meta_agent_size=2):
+        self.env = environment
+        self.max_expanded = max_expanded
+        self.time_limit = time_limit
+        self.profiler = profiler
+        # ICBS: split on cardinal conflicts first, classified with MDDs
+        self.prioritize_conflicts = prioritize_conflicts
+        # low level ties are broken towards fewer conflicts with the other agents' paths
+        self.avoid_conflicts = avoid_conflicts
+        # split conflicts with a positive and a negative constraint on one agent
+        self.disjoint_splitting = disjoint_splitting
+        # MA-CBS: two meta-agents are merged once they conflicted more than this many times
+        self.merge_threshold = merge_threshold
+        # larger meta-agents are not formed, their conflicts are split instead;
+        # joint searches grow exponentially with the number of agents
+        self.max_meta_agent_size = max_meta_agent_size
+        self.conflict_counts = {}
+        # entries: (cost, number of conflicts, insertion order, node)
+        self.open_list = []
+
+    def push(self, node, result):
+        result.stats['generated'] += 1
+        heappush(self.open_list, (node.cost, len(node.conflicts), result.stats['generated'], node))
 
-                # TODO: ending condition
-                if new_node not in self.closed_set:
-                    self.open_set |= {new_node}
+    def search(self):
+        result = SearchResult()
+        start_time = time.time()
+        profiler = self.profiler
+        self.env.profiler = profiler
+        self.env.deadline = self.get_deadline(start_time)
+
+        start = self.create_root()
+        if start is None:
+            return self.finish(result, start_time)
+        self.push(start, result)
+
+        while self.open_list:
+            if self.limit_reached(result, start_time):
+                break
+
+            P = heappop(self.open_list)[-1]
+            result.stats['expanded'] += 1
+
+            if profiler is not None:
+                profiler.event('expand', cost=P.cost, conflicts=len(P.conflicts))
+                section = perf_counter()
+            solution = P.get_solution()
+            if profiler is not None:
+                profiler.add_time('copy', section)
+            if not P.conflicts:
+                result.status = SearchResult.SOLVED
+                result.plan = self.generate_plan(solution)
+                result.cost = P.cost
+                break
+
+            conflict = self.select_conflict(P, solution)
+            for new_node, replanned in self.create_children(P, conflict):
+                child_solution = self.replan(new_node, solution, replanned)
+                if child_solution is not None:
+                    self.add_child(P, solution, new_node, child_solution, result)
+
+        return self.finish(result, start_time)
+
+    def select_conflict(self, node, solution):
+        """
+        conflict to split the node on, chosen with MDDs for ICBS
+        """
+        profiler = self.profiler
+        if self.prioritize_conflicts:
+            if profiler is not None:
+                section = perf_counter()
+            conflict, cardinality = self.choose_conflict(node, solution)
+            if profiler is not None:
+                profiler.add_time('mdd', section)
+                profiler.count(cardinality + '_conflicts')
+        else:
+            conflict = node.conflicts[0]
+        if profiler is not None:
+            conflict_type = 'vertex' if conflict.type == Conflict.VERTEX else 'edge'
+            profiler.count(conflict_type + '_conflicts')
+            profiler.event('conflict', type=conflict_type, timestep=conflict.time,
+                           agents=[conflict.agent_1, conflict.agent_2])
+        return conflict
+
+    def create_root(self):
+        """
+        root node with every agent planned alone, or None if one has no path
+        """
+        profiler = self.profiler
+        start = HighLevelNode()
+        start.groups = {agent: (agent,) for agent in self.env.agent_dict.keys()}
+        self.env.constraint_dict = {}
+        start.paths = self.env.compute_solution(self.avoid_conflicts)
+        if not start.paths:
+            return None
+        start.cost = self.env.compute_solution_cost(start.paths)
+        if profiler is not None:
+            section = perf_counter()
+        start.conflicts = self.env.get_all_conflicts(start.paths)
+        if profiler is not None:
+            profiler.add_time('conflict_detection', section)
+        return start
+
+    def create_children(self, node, conflict):
+        """
+        children of a node that resolve the conflict, as (child, agents to
+        replan) pairs; None replans the agents that break the new constraints
+        """
+        profiler = self.profiler
+        if self.merge_threshold is not None and self.should_merge(node, conflict):
+            # a single child, where the two meta-agents are planned jointly
+            new_node = self.merge(node, conflict.agent_1, conflict.agent_2)
+            if profiler is not None:
+                profiler.count('merges')
+                profiler.event('merge', agents=list(new_node.groups[conflict.agent_1]))
+            return [(new_node, new_node.groups[conflict.agent_1])]
+        if self.disjoint_splitting:
+            return [(self.node_type(node, constraint_dict), None)
+                    for constraint_dict in self.env.create_disjoint_constraints(conflict)]
+        return [(self.node_type(node, {agent: constraints}), None) for agent, constraints in
+                self.env.create_constraints_from_conflict(conflict).items()]
+
+    def add_child(self, node, solution, new_node, child_solution, result):
+        """
+        Sets the cost and conflicts of a replanned child from its parent's
+        and pushes it. Children with the same paths as another node are kept:
+        their constraints differ, so they root different subtrees.
+        """
+        profiler = self.profiler
+        new_node.cost = node.cost
+        for agent, path in new_node.paths.items():
+            new_node.cost += len(path) - len(solution[agent])
+
+        if profiler is not None:
+            section = perf_counter()
+        conflicts = node.conflicts
+        for agent in new_node.paths.keys():
+            conflicts = self.env.patch_conflicts(conflicts, child_solution, agent)
+        new_node.conflicts = conflicts
+        if profiler is not None:
+            profiler.add_time('conflict_detection', section)
+            profiler.event('generate', agents=list(new_node.paths.keys()), cost=new_node.cost,
+                           conflicts=len(new_node.conflicts))
+
+        self.push(new_node, result)
+
+    def get_replanned_groups(self, node, solution, agents=None):
+        """
+        meta-agents of the given agents, by default of the ones whose paths
+        break the node's new constraints
+        """
+        if agents is None:
+            agents = self.env.get_violating_agents(solution, node.constraints)
+        groups = []
+        for agent in agents:
+            if node.groups[agent] not in groups:
+                groups.append(node.groups[agent])
+        return groups
+
+    def replan(self, node, solution, agents=None):
+        """
+        Replans the given agents, by default the ones whose paths break the
+        node's new constraints, together with the rest of their meta-agents;
+        the other paths are shared with the parent. Returns the node's
+        solution, or None if one of them has no path left.
+        """
+        profiler = self.profiler
+        child_solution = dict(solution)
+        for group in self.get_replanned_groups(node, solution, agents):
+            if profiler is not None:
+                section = perf_counter()
+            self.env.constraint_dict = {agent: ConstraintTable(node.get_constraints(agent)) for agent in group}
+            conflict_table = None
+            if self.avoid_conflicts:
+                conflict_table = ConflictAvoidanceTable({agent: path for agent, path in child_solution.items()
+                                                         if agent not in group})
+            if profiler is not None:
+                profiler.add_time('copy', section)
+            paths = self.env.compute_group_solution(group, conflict_table)
+            if not paths:
+                return None
+            node.paths.update(paths)
+            child_solution.update(paths)
+        return child_solution
+
+    def should_merge(self, node, conflict):
+        """
+        Counts the conflict between its two agents. Their meta-agents are
+        merged once the agents of the two conflicted more than
+        merge_threshold times over the whole search, unless the merged
+        meta-agent would have more than max_meta_agent_size agents.
+        """
+        pair = tuple(sorted((conflict.agent_1, conflict.agent_2)))
+        self.conflict_counts[pair] = self.conflict_counts.get(pair, 0) + 1
+        group_1 = node.groups[conflict.agent_1]
+        group_2 = node.groups[conflict.agent_2]
+        count = sum([self.conflict_counts.get(tuple(sorted((agent_1, agent_2))), 0)
+                     for agent_1 in group_1 for agent_2 in group_2])
+        if len(group_1) + len(group_2) > self.max_meta_agent_size:
+            return False
+        return count > self.merge_threshold
+
+    def merge(self, node, agent_1, agent_2):
+        child = self.node_type(node)
+        child.groups = dict(node.groups)
+        merged = tuple(sorted(node.groups[agent_1] + node.groups[agent_2]))
+        for agent in merged:
+            child.groups[agent] = merged
+        return child
+
+    def get_deadline(self, start_time):
+        if self.time_limit is None:
+            return None
+        return start_time + self.time_limit
+
+    def limit_reached(self, result, start_time):
+        if self.max_expanded is not None and result.stats['expanded'] >= self.max_expanded:
+            result.status = SearchResult.NODE_LIMIT
+            return True
+        if self.time_limit is not None and time.time() - start_time >= self.time_limit:
+            result.status = SearchResult.TIME_LIMIT
+            return True
+        return False
 
-        return {}
+    def get_mdd(self, node, agent, solution):
+        owner = node.get_constraint_owner(agent)
+        if owner.mdds is None:
+            owner.mdds = {}
+        mdd = owner.mdds.get(agent)
+        if mdd is None:
+            mdd = MDD(self.env, agent, ConstraintTable(owner.get_constraints(agent)), len(solution[agent]))
+            owner.mdds[agent] = mdd
+        return mdd
+
+    def classify_conflict(self, node, solution, conflict):
+        mdd_1 = self.get_mdd(node, conflict.agent_1, solution)
+        mdd_2 = self.get_mdd(node, conflict.agent_2, solution)
+        time = conflict.time
+        if conflict.type == Conflict.VERTEX:
+            cardinal_1 = mdd_1.is_singleton(time, conflict.location_1.key)
+            cardinal_2 = mdd_2.is_singleton(time, conflict.location_1.key)
+        else:
+            # agent_1 moves from location_1 to location_2, agent_2 the other way
+            cardinal_1 = mdd_1.is_singleton(time, conflict.location_1.key) \
+                and mdd_1.is_singleton(time + 1, conflict.location_2.key)
+            cardinal_2 = mdd_2.is_singleton(time, conflict.location_2.key) \
+                and mdd_2.is_singleton(time + 1, conflict.location_1.key)
+        if cardinal_1 and cardinal_2:
+            return Conflict.CARDINAL
+        if cardinal_1 or cardinal_2:
+            return Conflict.SEMI_CARDINAL
+        return Conflict.NON_CARDINAL
+
+    def choose_conflict(self, node, solution):
+        """
+        first cardinal conflict, else the first semi-cardinal one, else the
+        first conflict
+        """
+        chosen, chosen_cardinality = node.conflicts[0], Conflict.NON_CARDINAL
+        for conflict in node.conflicts:
+            cardinality = self.classify_conflict(node, solution, conflict)
+            if cardinality == Conflict.CARDINAL:
+                return conflict, cardinality
+            if cardinality == Conflict.SEMI_CARDINAL and chosen_cardinality == Conflict.NON_CARDINAL:
+                chosen, chosen_cardinality = conflict, cardinality
+        return chosen, chosen_cardinality
+
+    def finish(self, result, start_time):
+        result.stats['runtime'] = time.time() - start_time
+        # a joint search cut at the deadline may have emptied the open list
+        if result.status == SearchResult.NO_SOLUTION and self.time_limit is not None \
+                and result.stats['runtime'] >= self.time_limit:
+            result.status = SearchResult.TIME_LIMIT
+        if self.profiler is not None:
+            result.profile = self.profiler.get_profile()
+            self.profiler.event('finish', status=result.status, cost=result.cost, **result.stats)
+        return result
 
     def generate_plan(self, solution):
         plan = {}
@@ -307,37 +980,220 @@ class CBS(object):
             plan[agent] = path_dict_list
         return plan
 
+class ECBSNode(HighLevelNode):
+    """
+    High-level node that also carries the lower bound of its solution cost:
+    the sum of the agents' low level lower bounds
+    """
+    def __init__(self, parent=None, constraints=None):
+        HighLevelNode.__init__(self, parent, constraints)
+        self.lower_bound = 0
+        # lower bounds of the paths set in this node
+        self.lower_bounds = {}
+        self.closed = False
+
+    def get_path_lower_bound(self, agent):
+        return self.get_path_owner(agent).lower_bounds[agent]
+
+class ECBS(CBS):
+    """
+    Enhanced CBS, bounded-suboptimal: both levels are focal searches with
+    the number of conflicts as secondary heuristic. The high level expands,
+    among the nodes costing at most w times the lowest lower bound, the one
+    with the fewest conflicts, so the solution costs at most w times the
+    optimum. Conflicts are split on the first one, with one negative
+    constraint per agent.
+    """
+    node_type = ECBSNode
+
+    def __init__(self, environment, w, max_expanded=None, time_limit=None, profiler=None):
+        if w < 1:
+            raise ValueError("suboptimality factor must be at least 1, got " + str(w))
+        CBS.__init__(self, environment, max_expanded, time_limit, profiler)
+        self.w = w
+        # open_list is ordered by lower bound, the focal list entries are
+        # (number of conflicts, cost, insertion order, node); nodes outside
+        # the focal bound wait ordered by cost
+        self.focal_list = []
+        self.waiting = []
+        self.lower_bound = 0
+        self.bound = 0
+
+    def push(self, node, result):
+        result.stats['generated'] += 1
+        order = result.stats['generated']
+        heappush(self.open_list, (node.lower_bound, order, node))
+        if node.cost <= self.bound:
+            heappush(self.focal_list, (len(node.conflicts), node.cost, order, node))
+        else:
+            heappush(self.waiting, (node.cost, order, node))
+
+    def update_focal(self):
+        while self.open_list and self.open_list[0][-1].closed:
+            heappop(self.open_list)
+        if not self.open_list:
+            return
+        self.lower_bound = self.open_list[0][0]
+        if self.w * self.lower_bound > self.bound:
+            self.bound = self.w * self.lower_bound
+            while self.waiting and self.waiting[0][0] <= self.bound:
+                cost, order, node = heappop(self.waiting)
+                heappush(self.focal_list, (len(node.conflicts), cost, order, node))
+
+    def compute_solution(self):
+        """
+        root solution, each agent avoiding the paths planned before its own
+        """
+        solution = {}
+        lower_bounds = {}
+        conflict_table = ConflictAvoidanceTable()
+        self.env.constraint_dict = {}
+        for agent in self.env.agent_dict.keys():
+            path, lower_bound = self.env.compute_agent_focal_solution(agent, self.w, conflict_table)
+            if not path:
+                return False, None
+            solution[agent] = path
+            lower_bounds[agent] = lower_bound
+            conflict_table.add_path(path)
+        return solution, lower_bounds
+
+    def search(self):
+        result = SearchResult()
+        start_time = time.time()
+        profiler = self.profiler
+        self.env.profiler = profiler
+
+        start = ECBSNode()
+        start.groups = {agent: (agent,) for agent in self.env.agent_dict.keys()}
+        start.paths, start.lower_bounds = self.compute_solution()
+        if not start.paths:
+            return self.finish(result, start_time)
+        start.cost = self.env.compute_solution_cost(start.paths)
+        start.lower_bound = sum(start.lower_bounds.values())
+        start.conflicts = self.env.get_all_conflicts(start.paths)
+
+        self.bound = self.w * start.lower_bound
+        self.push(start, result)
+
+        while True:
+            self.update_focal()
+            if not self.focal_list or self.limit_reached(result, start_time):
+                break
+
+            P = heappop(self.focal_list)[-1]
+            P.closed = True
+            result.stats['expanded'] += 1
+            if profiler is not None:
+                profiler.event('expand', cost=P.cost, lower_bound=P.lower_bound, conflicts=len(P.conflicts))
+
+            solution = P.get_solution()
+            if not P.conflicts:
+                result.status = SearchResult.SOLVED
+                result.plan = self.generate_plan(solution)
+                result.cost = P.cost
+                result.stats['lower_bound'] = self.lower_bound
+                break
+
+            conflict = self.select_conflict(P, solution)
+            for new_node, replanned in self.create_children(P, conflict):
+                child_solution = self.replan(new_node, solution, replanned)
+                if child_solution is not None:
+                    self.add_child(P, solution, new_node, child_solution, result)
+
+        return self.finish(result, start_time)
+
+    def replan(self, node, solution, agents=None):
+        """
+        Replans the agents that break the node's new constraints with a
+        focal search and updates the node's lower bound
+        """
+        child_solution = dict(solution)
+        node.lower_bound = node.parent.lower_bound
+        for group in self.get_replanned_groups(node, solution, agents):
+            # ECBS does not merge agents, every group is a single one
+            agent = group[0]
+            self.env.constraint_dict = {agent: ConstraintTable(node.get_constraints(agent))}
+            conflict_table = ConflictAvoidanceTable(child_solution, agent)
+            path, lower_bound = self.env.compute_agent_focal_solution(agent, self.w, conflict_table)
+            if not path:
+                return None
+            # the agent only gained constraints, its previous lower bound still holds
+            parent_lower_bound = node.parent.get_path_lower_bound(agent)
+            node.paths[agent] = path
+            node.lower_bounds[agent] = max(lower_bound, parent_lower_bound)
+            node.lower_bound += node.lower_bounds[agent] - parent_lower_bound
+            child_solution[agent] = path
+        return child_solution
+
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("param", help="input file containing map and obstacles")
     parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--heuristic-cache", default=None, help="directory to persist distance-to-goal tables in")
+    parser.add_argument("--max-nodes", type=int, default=None, help="maximum number of high-level nodes to expand")
+    parser.add_argument("--time-limit", type=float, default=None, help="wall-clock limit of the search in seconds")
+    parser.add_argument("--icbs", action='store_true', help="split on cardinal conflicts first (Improved CBS)")
+    parser.add_argument("--disjoint-splitting", action='store_true',
+                        help="split conflicts with a positive and a negative constraint on one agent")
+    parser.add_argument("--merge-threshold", type=int, default=None,
+                        help="MA-CBS: plan two groups of agents jointly once they conflicted more than this many times")
+    parser.add_argument("--max-meta-agent-size", type=int, default=2,
+                        help="MA-CBS: largest group of agents planned jointly, larger merges are split instead")
+    parser.add_argument("--no-conflict-avoidance", action='store_true',
+                        help="do not break low level ties towards fewer conflicts with the other agents")
+    parser.add_argument("--suboptimality", type=float, default=None,
+                        help="bounded-suboptimal ECBS, the cost is at most this factor (>= 1) times the optimum")
+    parser.add_argument("--sipp", action='store_true',
+                        help="plan single agents on safe intervals (SIPP) instead of timesteps")
+    parser.add_argument("--profile", action='store_true', help="print search counters and section times")
+    parser.add_argument("--trace", default=None, help="file to stream search events to, as JSON lines")
     args = parser.parse_args()
+    if args.suboptimality is not None:
+        if args.suboptimality < 1:
+            parser.error("--suboptimality must be at least 1")
+        # the focal searches split on the first conflict and plan single agents on timesteps
+        for flag, used in (('--icbs', args.icbs), ('--disjoint-splitting', args.disjoint_splitting),
+                           ('--merge-threshold', args.merge_threshold is not None), ('--sipp', args.sipp)):
+            if used:
+                parser.error(flag + " cannot be combined with --suboptimality")
 
     # Read from input file
-    with open(args.param, 'r') as param_file:
-        try:
-            param = yaml.load(param_file, Loader=yaml.FullLoader)
-        except yaml.YAMLError as exc:
-            print(exc)
+    try:
+        param = load_instance(args.param)
+    except yaml.YAMLError as exc:
+        print(exc)
 
     dimension = param["map"]["dimensions"]
     obstacles = param["map"]["obstacles"]
     agents = param['agents']
 
-    env = Environment(dimension, agents, obstacles)
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache, args.sipp)
 
     # Searching
-    cbs = CBS(env)
-    solution = cbs.search()
-    if not solution:
+    profiler = None
+    trace_file = open(args.trace, 'w') if args.trace else None
+    if args.profile or trace_file:
+        profiler = SearchProfiler(trace_file)
+    if args.suboptimality is not None:
+        cbs = ECBS(env, args.suboptimality, args.max_nodes, args.time_limit, profiler)
+    else:
+        cbs = CBS(env, args.max_nodes, args.time_limit, profiler, args.icbs, not args.no_conflict_avoidance,
+                  args.disjoint_splitting, args.merge_threshold, args.max_meta_agent_size)
+    result = cbs.search()
+    if trace_file:
+        trace_file.close()
+    print(result)
+    if args.profile:
+        print(profiler)
+    if not result:
         print(" Solution not found" )
         return
 
     # Write to output file
     output = dict()
-    output["schedule"] = solution
-    output["cost"] = env.compute_solution_cost(solution)
+    output["schedule"] = result.plan
+    output["cost"] = result.cost
     with open(args.output, 'w') as output_yaml:
         yaml.safe_dump(output, output_yaml)
 
@@ -0,0 +1,158 @@
+"""
+
+Independence detection (Standley) front end for CBS
+
+Every agent is first planned on its own. While the paths of different
+groups conflict, the conflicting groups are merged and solved again with
+CBS. The groups of a round are solved in parallel worker processes, and
+the paths of all the groups are stitched into one schedule.
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import os
+import time
+import yaml
+from concurrent.futures import ProcessPoolExecutor
+
+from cbs.cbs import Environment, CBS, SearchResult
+from utils.instance import load_instance
+from utils.state import Location, State
+
+def solve_group(dimension, obstacles, agents, time_limit, icbs, disjoint_splitting):
+    """
+    Runs in a worker process, returns the CBS status, plan and statistics
+    for a group of agents
+    """
+    env = Environment(dimension, agents, obstacles)
+    cbs = CBS(env, time_limit=time_limit, prioritize_conflicts=icbs, disjoint_splitting=disjoint_splitting)
+    result = cbs.search()
+    return result.status, result.plan, result.stats
+
+class IndependenceDetection(object):
+    def __init__(self, dimension, agents, obstacles, workers=None, time_limit=None, icbs=False, disjoint_splitting=False):
+        self.dimension = dimension
+        self.agents = agents
+        self.obstacles = obstacles
+        self.workers = workers
+        self.time_limit = time_limit
+        self.icbs = icbs
+        self.disjoint_splitting = disjoint_splitting
+        self.agent_dict = {agent['name']: agent for agent in agents}
+        # only used to find the conflicts between the groups' paths
+        self.env = Environment(dimension, agents, obstacles)
+
+    def plan_to_solution(self, plan):
+        return {agent: [State(s['t'], Location(s['x'], s['y'])) for s in path] for agent, path in plan.items()}
+
+    def merge_groups(self, groups, conflicts):
+        """
+        groups after merging the groups of every conflicting pair of agents,
+        in the order of the agents
+        """
+        group_of = {agent: frozenset(group) for group in groups for agent in group}
+        for conflict in conflicts:
+            group_1 = group_of[conflict.agent_1]
+            group_2 = group_of[conflict.agent_2]
+            if group_1 != group_2:
+                merged = group_1 | group_2
+                for agent in merged:
+                    group_of[agent] = merged
+        order = {agent['name']: i for i, agent in enumerate(self.agents)}
+        merged_groups = []
+        for agent in self.agents:
+            group = tuple(sorted(group_of[agent['name']], key=order.get))
+            if group not in merged_groups:
+                merged_groups.append(group)
+        return merged_groups
+
+    def search(self):
+        result = SearchResult()
+        result.stats['groups'] = 0
+        result.stats['largest_group'] = 0
+        start_time = time.time()
+
+        groups = [(agent['name'],) for agent in self.agents]
+        pending = groups
+        plan = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                time_limit = None
+                if self.time_limit is not None:
+                    time_limit = self.time_limit - (time.time() - start_time)
+                    if time_limit <= 0:
+                        result.status = SearchResult.TIME_LIMIT
+                        break
+
+                futures = [pool.submit(solve_group, self.dimension, self.obstacles,
+                                       [self.agent_dict[agent] for agent in group], time_limit,
+                                       self.icbs, self.disjoint_splitting) for group in pending]
+                statuses = []
+                for future in futures:
+                    status, group_plan, stats = future.result()
+                    result.stats['expanded'] += stats['expanded']
+                    result.stats['generated'] += stats['generated']
+                    statuses.append(status)
+                    plan.update(group_plan)
+                failed = [status for status in statuses if status != SearchResult.SOLVED]
+                if failed:
+                    result.status = failed[0]
+                    break
+
+                conflicts = self.env.get_all_conflicts(self.plan_to_solution(plan))
+                if not conflicts:
+                    result.status = SearchResult.SOLVED
+                    result.plan = {agent['name']: plan[agent['name']] for agent in self.agents}
+                    result.cost = sum([len(path) for path in plan.values()])
+                    break
+                merged_groups = self.merge_groups(groups, conflicts)
+                pending = [group for group in merged_groups if group not in groups]
+                groups = merged_groups
+
+        result.stats['groups'] = len(groups)
+        result.stats['largest_group'] = max([len(group) for group in groups])
+        result.stats['runtime'] = time.time() - start_time
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--time-limit", type=float, default=None, help="wall-clock limit of the search in seconds")
+    parser.add_argument("--icbs", action='store_true', help="split on cardinal conflicts first (Improved CBS)")
+    parser.add_argument("--disjoint-splitting", action='store_true',
+                        help="split conflicts with a positive and a negative constraint on one agent")
+    args = parser.parse_args()
+
+    # Read from input file
+    try:
+        param = load_instance(args.param)
+    except yaml.YAMLError as exc:
+        print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    # Searching
+    independence_detection = IndependenceDetection(dimension, agents, obstacles, args.workers, args.time_limit,
+                                                   args.icbs, args.disjoint_splitting)
+    result = independence_detection.search()
+    print(result)
+    if not result:
+        print(" Solution not found" )
+        return
+
+    # Write to output file
+    output = dict()
+    output["schedule"] = result.plan
+    output["cost"] = result.cost
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+
+Coupled A* search for meta-agents
+
+The agents of a group are planned jointly over the product of their
+individual state spaces: a joint state holds every member's location at a
+timestep, and members may not collide with each other. A member can stop
+at its goal once its constraints allow it; it then stays there at no
+cost, so the cost of a joint plan is its sum of costs.
+
+The joint moves are generated with operator decomposition: an
+intermediate state assigns the next move of one more member, so a state
+has a handful of successors instead of one per combination of moves.
+
+After the last constraint of the members and the end of the other agents'
+paths, nothing depends on the time any more, so the states from then on
+share one time in their key: the state space is finite and the search
+ends when the group has no joint plan.
+
+"""
+from time import time as wall_clock
+from heapq import heappush, heappop
+
+from utils.state import State
+
+class JointAStar(object):
+    def __init__(self, env):
+        self.env = env
+        # joint states expanded by the last search
+        self.expanded = 0
+
+    def member_heuristic(self, agent, constraint_table, time, location):
+        self.env.constraints = constraint_table
+        return self.env.admissible_heuristic(State(time, location), agent)
+
+    def can_stop(self, agent, constraint_table, time, location):
+        self.env.constraints = constraint_table
+        return self.env.is_at_goal(State(time, location), agent)
+
+    def reconstruct_paths(self, agents, came_from, locations_of, time_of, current_key):
+        # only the full joint states, the intermediate ones have a non-empty move prefix
+        keys = [current_key]
+        while keys[-1] in came_from:
+            keys.append(came_from[keys[-1]])
+        keys = [key for key in reversed(keys) if not key[3]]
+        paths = {}
+        for i, agent in enumerate(agents):
+            path = []
+            for key in keys:
+                if key[2] >> i & 1:
+                    break
+                path.append(State(time_of[key], locations_of[key][0][i]))
+            paths[agent] = path
+        return paths
+
+    def search(self, agents, constraint_tables, conflict_table=None, deadline=None):
+        """
+        collision-free paths of the agents, each under its own constraint
+        table, with the lowest sum of costs, or False, also once the
+        deadline (wall-clock time) has passed
+        """
+        env = self.env
+        size = len(agents)
+        everyone = (1 << size) - 1
+        step_cost = 1
+
+        # keys: (time, member cells, bit mask of the members that stopped,
+        # (cell, stops) of the members whose next move is already chosen);
+        # the times after the last constrained one are all keyed as last_time
+        last_time = max([table.max_time for table in constraint_tables]) + 1
+        if conflict_table is not None:
+            last_time = max(last_time, conflict_table.max_time + 1)
+        start = tuple([env.agent_dict[agent]["start"].location for agent in agents])
+        start_key = (0, tuple([location.key for location in start]), 0, ())
+        # key -> (member locations, (location, stops) of the chosen moves)
+        locations_of = {start_key: (start, ())}
+        time_of = {start_key: 0}
+        came_from = {}
+        g_score = {start_key: 0}
+        conflict_score = {start_key: 0}
+        h_score = {start_key: sum([self.member_heuristic(agent, constraint_tables[i], 0, start[i])
+                                   for i, agent in enumerate(agents)])}
+        closed_set = set()
+
+        # open list entries: (f, conflicts, -g, insertion order, key)
+        counter = 0
+        open_heap = [(h_score[start_key], 0, 0, counter, start_key)]
+        expanded = 0
+
+        while open_heap:
+            _, conflicts, neg_g, _, current_key = heappop(open_heap)
+            if current_key in closed_set:
+                continue
+            _, cells, stopped, prefix = current_key
+            time = time_of[current_key]
+            locations, moves = locations_of[current_key]
+            i = len(prefix)
+
+            if i == 0:
+                remaining = [j for j in range(size) if not stopped >> j & 1]
+                if all([self.can_stop(agents[j], constraint_tables[j], time, locations[j]) for j in remaining]):
+                    self.expanded = expanded
+                    # the members that had not stopped yet all stop at this time
+                    final_key = (min(time, last_time), cells, everyone, ())
+                    came_from[final_key] = current_key
+                    locations_of[final_key] = (locations, ())
+                    time_of[final_key] = time
+                    return self.reconstruct_paths(agents, came_from, locations_of, time_of, final_key)
+
+            closed_set.add(current_key)
+            expanded += 1
+            if deadline is not None and expanded % 1024 == 0 and wall_clock() >= deadline:
+                break
+
+            # next move of member i; a stopped member waits at its goal
+            agent = agents[i]
+            if stopped >> i & 1:
+                options = [(locations[i], True)]
+            else:
+                env.constraints = constraint_tables[i]
+                options = [(state.location, False) for state in env.get_neighbors(State(time, locations[i]))]
+                if self.can_stop(agent, constraint_tables[i], time, locations[i]):
+                    options.append((locations[i], True))
+                h_before = self.member_heuristic(agent, constraint_tables[i], time, locations[i])
+
+            for location, stops in options:
+                # no vertex or swap conflict with the members that already moved
+                if any([moved.key == location.key or (moved.key == cells[i] and location.key == cells[j])
+                        for j, (moved, _) in enumerate(moves)]):
+                    continue
+
+                next_moves = moves + ((location, stops),)
+                tentative_g_score = -neg_g
+                next_conflicts = conflicts
+                h = h_score[current_key]
+                if not stopped >> i & 1:
+                    h -= h_before
+                    # a member that stops at this time costs nothing from now on
+                    if not stops:
+                        tentative_g_score += step_cost
+                        h += self.member_heuristic(agent, constraint_tables[i], time + 1, location)
+                        if conflict_table is not None:
+                            next_conflicts += conflict_table.count_conflicts(time + 1, cells[i], location.key)
+
+                if i + 1 < size:
+                    next_time = time
+                    next_key = (min(time, last_time), cells, stopped, tuple([(moved.key, moved_stops) for moved, moved_stops in next_moves]))
+                    next_locations = (locations, next_moves)
+                else:
+                    next_stopped = stopped
+                    for j, (_, moved_stops) in enumerate(next_moves):
+                        if moved_stops:
+                            next_stopped |= 1 << j
+                    next_time = time + 1
+                    next_key = (min(next_time, last_time), tuple([moved.key for moved, _ in next_moves]),
+                                next_stopped, ())
+                    next_locations = (tuple([moved for moved, _ in next_moves]), ())
+
+                if next_key in closed_set:
+                    continue
+                g = g_score.get(next_key)
+                if g is not None and (tentative_g_score > g or
+                                      (tentative_g_score == g and next_conflicts >= conflict_score[next_key])):
+                    continue
+
+                came_from[next_key] = current_key
+                locations_of[next_key] = next_locations
+                time_of[next_key] = next_time
+                g_score[next_key] = tentative_g_score
+                conflict_score[next_key] = next_conflicts
+                h_score[next_key] = h
+
+                counter += 1
+                heappush(open_heap, (tentative_g_score + h, next_conflicts, -tentative_g_score, counter, next_key))
+        self.expanded = expanded
+        return False
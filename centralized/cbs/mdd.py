@@ -0,0 +1,62 @@
+"""
+
+Multi-valued decision diagrams for Improved CBS
+
+An MDD holds, for each timestep, the cells an agent can occupy on some
+path of a fixed length that respects its constraints. A conflict is
+cardinal for an agent when its MDD has a single node at the conflicting
+timestep(s): every path of that length then runs into it.
+
+"""
+
+class MDD(object):
+    def __init__(self, env, agent, constraints, length):
+        """
+        constraints is the agent's ConstraintTable, length the number of
+        states of its paths
+        """
+        start = env.agent_dict[agent]["start"].location
+        self.goal = env.agent_dict[agent]["goal"].location
+        heuristic = env.heuristic_dict[agent]
+        grid_map = env.grid_map
+        last = length - 1
+
+        # forward pass: cells reachable at each time that can still reach the goal in time
+        forward = [{start.key: start}]
+        for t in range(last):
+            level = {}
+            for cell, location in forward[t].items():
+                for next_location in grid_map.get_moves(location):
+                    if next_location.key in level:
+                        continue
+                    if t + 1 + heuristic[next_location.x][next_location.y] > last:
+                        continue
+                    if constraints.is_vertex_constrained(t + 1, next_location.key):
+                        continue
+                    if next_location.key != cell and constraints.is_edge_constrained(t, cell, next_location.key):
+                        continue
+                    landmark = constraints.get_landmark(t + 1)
+                    if landmark is not None and next_location.key != landmark.key:
+                        continue
+                    level[next_location.key] = next_location
+            forward.append(level)
+
+        # backward pass: keep the cells that lead to the goal at the last timestep
+        self.levels = [None] * length
+        self.levels[last] = {self.goal.key: self.goal} if self.goal.key in forward[last] else {}
+        for t in range(last - 1, -1, -1):
+            successors = self.levels[t+1]
+            self.levels[t] = {cell: location for cell, location in forward[t].items()
+                              if any([next_location.key in successors and (next_location.key == cell or
+                                      not constraints.is_edge_constrained(t, cell, next_location.key))
+                                      for next_location in grid_map.get_moves(location)])}
+
+    def is_singleton(self, time, cell):
+        """
+        True if every path of the MDD is at cell at that time, the agent
+        waits at its goal after the last timestep
+        """
+        if time >= len(self.levels):
+            return cell == self.goal.key
+        level = self.levels[time]
+        return len(level) == 1 and cell in level
@@ -0,0 +1,247 @@
+"""
+
+Parallel high-level node expansion for CBS
+
+The cheapest open nodes are expanded in batches: the conflicts are split
+in the main process, and the low-level replans of all the children of a
+batch run concurrently in worker processes, one task per expanded node.
+Every worker holds its own Environment and the root solution, so a task
+only sends the children's constraints and the paths that differ from the
+root, as cell keys. Each task still costs an inter-process round trip,
+which outweighs the low-level searches on small maps.
+
+A node without conflicts is only accepted when it is the cheapest open
+node, as in serial CBS, so the solution cost is the same optimum.
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import os
+import time
+import yaml
+from heapq import heappush, heappop
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from cbs.cbs import Environment, CBS, SearchResult, ConstraintTable, ConflictAvoidanceTable
+from utils.instance import load_instance
+from utils.profiler import SearchProfiler
+from utils.state import State, unpack_cell
+
+# set up by init_worker in each worker process
+worker_env = None
+worker_root = None
+
+def path_to_cells(path):
+    return tuple([state.location.key for state in path])
+
+def cells_to_path(grid_map, cells):
+    return [State(t, grid_map.get_location(*unpack_cell(cell))) for t, cell in enumerate(cells)]
+
+def init_worker(dimension, agents, obstacles, heuristic_cache, sipp, root_cells, deadline):
+    global worker_env, worker_root
+    worker_env = Environment(dimension, agents, obstacles, heuristic_cache, sipp)
+    worker_env.deadline = deadline
+    worker_root = {agent: cells_to_path(worker_env.grid_map, cells) for agent, cells in root_cells.items()}
+
+def replan_children(children, changed_cells, avoid_conflicts):
+    """
+    Runs in a worker process: replans the children of one node, given as
+    (meta-agents, constraints by agent) pairs, in the node's solution made
+    of the root paths and the changed ones. Returns the new paths of each
+    child as cell keys, or None for a child where a group has no path left.
+    """
+    solution = dict(worker_root)
+    for agent, cells in changed_cells.items():
+        solution[agent] = cells_to_path(worker_env.grid_map, cells)
+    return [replan_groups(groups, constraints, solution, avoid_conflicts) for groups, constraints in children]
+
+def replan_groups(groups, constraints, solution, avoid_conflicts):
+    """
+    new paths of one child's meta-agents as cell keys, or None
+    """
+    env = worker_env
+    solution = dict(solution)
+    replanned = {}
+    for group in groups:
+        env.constraint_dict = {agent: ConstraintTable(constraints[agent]) for agent in group}
+        conflict_table = None
+        if avoid_conflicts:
+            conflict_table = ConflictAvoidanceTable({agent: path for agent, path in solution.items()
+                                                     if agent not in group})
+        paths = env.compute_group_solution(group, conflict_table)
+        if not paths:
+            return None
+        solution.update(paths)
+        replanned.update(paths)
+    return {agent: path_to_cells(path) for agent, path in replanned.items()}
+
+class ParallelCBS(CBS):
+    def __init__(self, environment, workers=None, max_expanded=None, time_limit=None, profiler=None,
+                 prioritize_conflicts=False, avoid_conflicts=True, disjoint_splitting=False, merge_threshold=None,
+                 max_meta_agent_size=2, heuristic_cache=None):
+        CBS.__init__(self, environment, max_expanded, time_limit, profiler, prioritize_conflicts,
+                     avoid_conflicts, disjoint_splitting, merge_threshold, max_meta_agent_size)
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.heuristic_cache = heuristic_cache
+        self.root_solution = None
+
+    def pop_batch(self, result):
+        """
+        Up to one open node per worker, cheapest first. A node without
+        conflicts stops the batch, and is returned alone when it is the
+        cheapest one; otherwise it goes back to the open list.
+        """
+        batch = []
+        while self.open_list and len(batch) < self.workers:
+            if self.max_expanded is not None and result.stats['expanded'] >= self.max_expanded:
+                break
+            entry = heappop(self.open_list)
+            node = entry[-1]
+            if not node.conflicts:
+                if batch:
+                    heappush(self.open_list, entry)
+                else:
+                    batch.append(node)
+                break
+            batch.append(node)
+            result.stats['expanded'] += 1
+        return batch
+
+    def get_changed_cells(self, solution):
+        """
+        cell keys of the paths of a solution that differ from the root's
+        """
+        return {agent: path_to_cells(path) for agent, path in solution.items()
+                if path is not self.root_solution[agent]}
+
+    def search(self):
+        result = SearchResult()
+        start_time = time.time()
+        profiler = self.profiler
+        self.env.profiler = profiler
+        self.env.deadline = self.get_deadline(start_time)
+
+        start = self.create_root()
+        if start is None:
+            return self.finish(result, start_time)
+        self.root_solution = start.paths
+        self.push(start, result)
+
+        root_cells = {agent: path_to_cells(path) for agent, path in start.paths.items()}
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                 initargs=(self.env.dimension, self.env.agents, self.env.obstacles,
+                                           self.heuristic_cache, self.env.sipp, root_cells,
+                                           self.env.deadline)) as pool:
+            while self.open_list:
+                if self.limit_reached(result, start_time):
+                    break
+
+                batch = self.pop_batch(result)
+                if not batch[0].conflicts:
+                    result.status = SearchResult.SOLVED
+                    result.plan = self.generate_plan(batch[0].get_solution())
+                    result.cost = batch[0].cost
+                    break
+
+                # split every node of the batch, then replan all the children at once,
+                # one task per node so its changed paths are sent once
+                replans = []
+                for P in batch:
+                    if profiler is not None:
+                        profiler.event('expand', cost=P.cost, conflicts=len(P.conflicts))
+                    solution = P.get_solution()
+                    conflict = self.select_conflict(P, solution)
+                    new_nodes = []
+                    children = []
+                    for new_node, replanned in self.create_children(P, conflict):
+                        groups = self.get_replanned_groups(new_node, solution, replanned)
+                        constraints = {agent: new_node.get_constraints(agent) for group in groups for agent in group}
+                        new_nodes.append(new_node)
+                        children.append((groups, constraints))
+                    future = pool.submit(replan_children, children, self.get_changed_cells(solution),
+                                         self.avoid_conflicts)
+                    replans.append((P, solution, new_nodes, future))
+
+                if profiler is not None:
+                    section = perf_counter()
+                    profiler.count('low_level_searches', sum([len(new_nodes) for _, _, new_nodes, _ in replans]))
+                for P, solution, new_nodes, future in replans:
+                    for new_node, paths in zip(new_nodes, future.result()):
+                        if paths is None:
+                            continue
+                        new_node.paths = {agent: cells_to_path(self.env.grid_map, cells)
+                                          for agent, cells in paths.items()}
+                        child_solution = dict(solution)
+                        child_solution.update(new_node.paths)
+                        self.add_child(P, solution, new_node, child_solution, result)
+                if profiler is not None:
+                    profiler.add_time('parallel_low_level', section)
+
+        return self.finish(result, start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--heuristic-cache", default=None, help="directory to persist distance-to-goal tables in")
+    parser.add_argument("--max-nodes", type=int, default=None, help="maximum number of high-level nodes to expand")
+    parser.add_argument("--time-limit", type=float, default=None, help="wall-clock limit of the search in seconds")
+    parser.add_argument("--icbs", action='store_true', help="split on cardinal conflicts first (Improved CBS)")
+    parser.add_argument("--disjoint-splitting", action='store_true',
+                        help="split conflicts with a positive and a negative constraint on one agent")
+    parser.add_argument("--merge-threshold", type=int, default=None,
+                        help="MA-CBS: plan two groups of agents jointly once they conflicted more than this many times")
+    parser.add_argument("--max-meta-agent-size", type=int, default=2,
+                        help="MA-CBS: largest group of agents planned jointly, larger merges are split instead")
+    parser.add_argument("--no-conflict-avoidance", action='store_true',
+                        help="do not break low level ties towards fewer conflicts with the other agents")
+    parser.add_argument("--sipp", action='store_true',
+                        help="plan single agents on safe intervals (SIPP) instead of timesteps")
+    parser.add_argument("--profile", action='store_true', help="print search counters and section times")
+    parser.add_argument("--trace", default=None, help="file to stream search events to, as JSON lines")
+    args = parser.parse_args()
+
+    # Read from input file
+    try:
+        param = load_instance(args.param)
+    except yaml.YAMLError as exc:
+        print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache, args.sipp)
+
+    # Searching
+    profiler = None
+    trace_file = open(args.trace, 'w') if args.trace else None
+    if args.profile or trace_file:
+        profiler = SearchProfiler(trace_file)
+    cbs = ParallelCBS(env, args.workers, args.max_nodes, args.time_limit, profiler, args.icbs,
+                      not args.no_conflict_avoidance, args.disjoint_splitting, args.merge_threshold,
+                      args.max_meta_agent_size, args.heuristic_cache)
+    result = cbs.search()
+    if trace_file:
+        trace_file.close()
+    print(result)
+    if args.profile:
+        print(profiler)
+    if not result:
+        print(" Solution not found" )
+        return
+
+    # Write to output file
+    output = dict()
+    output["schedule"] = result.plan
+    output["cost"] = result.cost
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+
+Safe interval path planning (SIPP) low level for CBS
+
+The timesteps at which an agent's constraints forbid a cell split the
+cell's timeline into safe intervals. A search state is a cell and one of
+its safe intervals, reached at the earliest possible time, so waiting in
+a cell costs no expansions. Landmarks of positive constraints make every
+other cell unsafe at their time.
+
+See the article: DOI: 10.1109/ICRA.2011.5980306
+
+"""
+from heapq import heappush, heappop
+
+from utils.state import State
+
+INF = float('inf')
+
+class SafeIntervalSearch(object):
+    def __init__(self, env):
+        self.env = env
+        # states expanded by the last search
+        self.expanded = 0
+
+    def get_unsafe_times(self, constraints):
+        """
+        cell -> timesteps at which the cell is vertex constrained
+        """
+        unsafe_times = {}
+        for time, cells in constraints.vertex_table.items():
+            for cell in cells:
+                unsafe_times.setdefault(cell, []).append(time)
+        return unsafe_times
+
+    def get_safe_intervals(self, cell, unsafe_times, landmarks):
+        """
+        sorted (first, last) timesteps at which the agent may be at the cell
+        """
+        times = set(unsafe_times.get(cell, ()))
+        times.update([time for time, location in landmarks.items() if location.key != cell])
+        intervals = []
+        first = 0
+        for time in sorted(times):
+            if time > first:
+                intervals.append((first, time - 1))
+            first = max(first, time + 1)
+        intervals.append((first, INF))
+        return intervals
+
+    def reconstruct_path(self, came_from, arrivals, current, finish_time):
+        """
+        one State per timestep, the agent waits in a cell until it leaves it
+        """
+        steps = [arrivals[current]]
+        while current in came_from:
+            current = came_from[current]
+            steps.append(arrivals[current])
+        steps.reverse()
+        path = []
+        for (time, location), (next_time, _) in zip(steps, steps[1:] + [(finish_time + 1, None)]):
+            for t in range(time, next_time):
+                path.append(State(t, location))
+        return path
+
+    def search(self, agent_name, conflict_table=None, time_horizon=None):
+        """
+        optimal path under the agent's constraints, as one State per
+        timestep, or False. The conflict table and time horizon of the A*
+        low level are not used: the safe intervals are finite in number.
+        """
+        env = self.env
+        constraints = env.constraints
+        grid_map = env.grid_map
+        start = env.agent_dict[agent_name]["start"].location
+        goal = env.agent_dict[agent_name]["goal"].location
+        # landmarks at the goal after the agent arrived are met by staying there
+        last_landmark = constraints.get_last_landmark(goal.key) if constraints.landmarks else None
+        unsafe_times = self.get_unsafe_times(constraints)
+        intervals = {}
+
+        def get_intervals(location):
+            cell_intervals = intervals.get(location.key)
+            if cell_intervals is None:
+                cell_intervals = self.get_safe_intervals(location.key, unsafe_times, constraints.landmarks)
+                intervals[location.key] = cell_intervals
+            return cell_intervals
+
+        start_intervals = get_intervals(start)
+        if start_intervals[0][0] > 0:
+            self.expanded = 0
+            return False
+
+        # states are (cell, interval index); arrivals holds (earliest time, location)
+        start_key = (start.key, 0)
+        arrivals = {start_key: (0, start)}
+        came_from = {}
+        closed_set = set()
+
+        # open list entries: (f, tie, insertion order, key). Ties go to later
+        # arrivals, except with landmarks away from the goal: h then depends on
+        # the time, and the earlier of two arrivals with the same f must close
+        # a state first
+        tie_sign = 1 if last_landmark is not None else -1
+        counter = 0
+        open_heap = [(env.admissible_heuristic(State(0, start), agent_name), 0, counter, start_key)]
+        expanded = 0
+
+        while open_heap:
+            _, _, _, current_key = heappop(open_heap)
+            if current_key in closed_set:
+                continue
+            time, location = arrivals[current_key]
+            interval = get_intervals(location)[current_key[1]]
+
+            # the agent stays at its goal, so only its last interval is final
+            if location.key == goal.key and interval[1] == INF:
+                self.expanded = expanded
+                finish_time = time if last_landmark is None else max(time, last_landmark[0])
+                return self.reconstruct_path(came_from, arrivals, current_key, finish_time)
+
+            closed_set.add(current_key)
+            expanded += 1
+
+            # the agent can leave at any time until the end of its interval
+            for next_location in grid_map.get_moves(location):
+                if next_location.key == location.key:
+                    continue
+                earliest = time + 1
+                latest = interval[1] + 1
+                for index, (first, last) in enumerate(get_intervals(next_location)):
+                    if first > latest:
+                        break
+                    if last < earliest:
+                        continue
+                    arrival = max(earliest, first)
+                    end = min(latest, last)
+                    while arrival <= end and constraints.is_edge_constrained(arrival - 1, location.key,
+                                                                             next_location.key):
+                        arrival += 1
+                    if arrival > end:
+                        continue
+
+                    next_key = (next_location.key, index)
+                    if next_key in closed_set:
+                        continue
+                    previous = arrivals.get(next_key)
+                    if previous is not None and previous[0] <= arrival:
+                        continue
+                    arrivals[next_key] = (arrival, next_location)
+                    came_from[next_key] = current_key
+                    counter += 1
+                    h = env.admissible_heuristic(State(arrival, next_location), agent_name)
+                    heappush(open_heap, (arrival + h, tie_sign * arrival, counter, next_key))
+        self.expanded = expanded
+        return False
@@ -0,0 +1,153 @@
+"""
+
+Regression tests for CBS
+
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import unittest
+
+from cbs.cbs import Environment, CBS, ECBS
+from cbs.anytime_cbs import AnytimeCBS
+from cbs.parallel_cbs import ParallelCBS
+from utils.instance import load_instance
+from utils.state import State, Location
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmark')
+
+# a and c swap ends of row 2 while b crosses it, all three reach (2, 2) at t=2
+THREE_AGENTS = [{'name': 'a', 'start': [0, 2], 'goal': [4, 2]},
+                {'name': 'b', 'start': [2, 0], 'goal': [2, 4]},
+                {'name': 'c', 'start': [4, 2], 'goal': [0, 2]}]
+
+# children with the same paths but other constraints must not be pruned, the optimum is 20
+CROWDED = {'dimension': [4, 3], 'obstacles': [(1, 0)],
+           'agents': [{'name': 'a0', 'start': [0, 2], 'goal': [0, 0]},
+                      {'name': 'a1', 'start': [3, 1], 'goal': [2, 1]},
+                      {'name': 'a2', 'start': [3, 0], 'goal': [0, 1]},
+                      {'name': 'a3', 'start': [0, 1], 'goal': [3, 1]},
+                      {'name': 'a4', 'start': [3, 2], 'goal': [2, 2]}]}
+
+# disjoint splitting puts a0 at its goal (1, 0) after it arrived, which must not delay it; the optimum is 29
+GOAL_LANDMARK = {'dimension': [3, 5], 'obstacles': [[0, 4], [1, 3]],
+                 'agents': [{'name': 'a0', 'start': [2, 2], 'goal': [1, 0]},
+                            {'name': 'a1', 'start': [0, 2], 'goal': [2, 2]},
+                            {'name': 'a2', 'start': [0, 0], 'goal': [1, 1]},
+                            {'name': 'a3', 'start': [1, 2], 'goal': [1, 4]},
+                            {'name': 'a4', 'start': [1, 1], 'goal': [1, 2]},
+                            {'name': 'a5', 'start': [2, 3], 'goal': [0, 0]}]}
+
+def get_instances():
+    """
+    small instances as (name, dimension, agents, obstacles, optimal cost)
+    """
+    instances = [('three_agents', [5, 5], THREE_AGENTS, [], 18),
+                 ('crowded', CROWDED['dimension'], CROWDED['agents'], CROWDED['obstacles'], 20),
+                 ('goal_landmark', GOAL_LANDMARK['dimension'], GOAL_LANDMARK['agents'], GOAL_LANDMARK['obstacles'], 29)]
+    for name, cost in (('map_8by8_obst12_agents10_ex2', 54), ('map_8by8_obst12_agents10_ex7', 58)):
+        param = load_instance(os.path.join(BENCHMARK, '8x8_obst12', name + '.yaml'))
+        instances.append((name, param['map']['dimensions'], param['agents'], param['map']['obstacles'], cost))
+    return instances
+
+def get_cell(path, t):
+    state = path[min(t, len(path) - 1)]
+    return (state['x'], state['y'])
+
+class TestConflicts(unittest.TestCase):
+    def test_three_agents_in_one_cell(self):
+        env = Environment([5, 5], THREE_AGENTS, [])
+        solution = {'a': [State(t, Location(t, 2)) for t in range(5)],
+                    'b': [State(t, Location(2, t)) for t in range(5)],
+                    'c': [State(t, Location(4 - t, 2)) for t in range(5)]}
+        pairs = set([(c.time, c.agent_1, c.agent_2) for c in env.get_all_conflicts(solution)])
+        self.assertEqual(pairs, {(2, 'a', 'b'), (2, 'a', 'c'), (2, 'b', 'c')})
+        self.assertEqual(env.count_conflicts(solution), 3)
+
+    def test_three_agents_solution_is_collision_free(self):
+        result = CBS(Environment([5, 5], THREE_AGENTS, [])).search()
+        self.assertTrue(result)
+        plan = result.plan
+        for t in range(max([len(path) for path in plan.values()]) + 1):
+            cells = [get_cell(path, t) for path in plan.values()]
+            self.assertEqual(len(cells), len(set(cells)), "vertex conflict at t=%d" % t)
+            for a in plan:
+                for b in plan:
+                    if a < b and get_cell(plan[a], t) != get_cell(plan[a], t + 1):
+                        self.assertFalse(get_cell(plan[a], t) == get_cell(plan[b], t + 1) and
+                                         get_cell(plan[a], t + 1) == get_cell(plan[b], t),
+                                         "edge conflict at t=%d" % t)
+
+class TestSearch(unittest.TestCase):
+    def test_same_paths_other_constraints_are_expanded(self):
+        env = Environment(CROWDED['dimension'], CROWDED['agents'], CROWDED['obstacles'])
+        result = CBS(env).search()
+        self.assertTrue(result)
+        self.assertEqual(result.cost, 20)
+
+class TestOptimalCost(unittest.TestCase):
+    """
+    every optimal CBS variant must find a solution of the optimal cost
+    """
+    def check_variant(self, make_search, sipp=False):
+        for name, dimension, agents, obstacles, cost in get_instances():
+            with self.subTest(instance=name):
+                result = make_search(Environment(dimension, agents, obstacles, sipp=sipp)).search()
+                self.assertTrue(result)
+                self.assertEqual(result.cost, cost)
+                # a search run to the end proves its solution optimal
+                self.assertEqual(result.stats.get('lower_bound', cost), cost)
+
+    def test_cbs(self):
+        self.check_variant(lambda env: CBS(env))
+
+    def test_no_conflict_avoidance(self):
+        self.check_variant(lambda env: CBS(env, avoid_conflicts=False))
+
+    def test_icbs(self):
+        self.check_variant(lambda env: CBS(env, prioritize_conflicts=True))
+
+    def test_disjoint_splitting(self):
+        self.check_variant(lambda env: CBS(env, disjoint_splitting=True))
+
+    def test_icbs_disjoint_splitting(self):
+        self.check_variant(lambda env: CBS(env, prioritize_conflicts=True, disjoint_splitting=True))
+
+    def test_merging(self):
+        self.check_variant(lambda env: CBS(env, merge_threshold=0))
+        self.check_variant(lambda env: CBS(env, merge_threshold=0, max_meta_agent_size=3))
+
+    def test_merging_disjoint_splitting(self):
+        self.check_variant(lambda env: CBS(env, disjoint_splitting=True, merge_threshold=1))
+
+    def test_sipp_low_level(self):
+        self.check_variant(lambda env: CBS(env), sipp=True)
+
+    def test_sipp_disjoint_splitting(self):
+        self.check_variant(lambda env: CBS(env, disjoint_splitting=True), sipp=True)
+
+    def test_anytime(self):
+        self.check_variant(lambda env: AnytimeCBS(env))
+        self.check_variant(lambda env: AnytimeCBS(env, disjoint_splitting=True))
+
+    def test_parallel(self):
+        self.check_variant(lambda env: ParallelCBS(env, workers=2))
+
+class TestBoundedSuboptimal(unittest.TestCase):
+    def test_ecbs_within_bound(self):
+        for w in (1.0, 1.2, 1.5):
+            for name, dimension, agents, obstacles, cost in get_instances():
+                with self.subTest(instance=name, w=w):
+                    result = ECBS(Environment(dimension, agents, obstacles), w).search()
+                    self.assertTrue(result)
+                    self.assertLessEqual(result.cost, w * cost)
+                    self.assertLessEqual(result.stats['lower_bound'], cost)
+
+    def test_ecbs_rejects_factor_below_one(self):
+        env = Environment([5, 5], THREE_AGENTS, [])
+        with self.assertRaises(ValueError):
+            ECBS(env, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
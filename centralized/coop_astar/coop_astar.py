@@ -8,45 +8,29 @@ author: Ashwin Bose (@atb033)
 import sys
 sys.path.insert(0, '../')
 import argparse
+import time
 import yaml
-from math import fabs
 from itertools import combinations
 from copy import deepcopy
 
 from cbs.a_star import AStar
+from utils.grid_map import GridMap
+from utils.heuristic import DistanceTable
+from utils.instance import load_instance
+from utils.state import Location, State, state_key, edge_key
 
-class Location(object):
-    def __init__(self, x=-1, y=-1):
-        self.x = x
-        self.y = y
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
-    def __str__(self):
-        return str((self.x, self.y))
-
-class State(object):
-    def __init__(self, time, location):
-        self.time = time
-        self.location = location
-    def __eq__(self, other):
-        return self.time == other.time and self.location == other.location
-    def __hash__(self):
-        return hash(str(self.time)+str(self.location.x) + str(self.location.y))
-    def is_equal_except_time(self, state):
-        return self.location == state.location
-    def __str__(self):
-        return str((self.time, self.location.x, self.location.y))
-    
 class Transition(object):
+    __slots__ = ('state_1', 'state_2', 'key')
     def __init__(self, state_1, state_2):
         self.state_1 = state_1
         self.state_2 = state_2
         if state_1.time != state_2.time - 1:
             raise ValueError("Invalid transition -", str(state_1), "to", str(state_2))
+        self.key = edge_key(state_1.time, state_1.location.key, state_2.location.key)
     def __eq__(self, other):
-        return self.state_1 == other.state_1 and self.state_2 == other.state_2
+        return self.key == other.key
     def __hash__(self):
-        return hash(str(self.state_1)+str(self.state_2))
+        return self.key
     def __str__(self):
         return str((self.state_1, self.state_2))
     def reverse(self):
@@ -54,15 +38,27 @@ class Transition(object):
                           State(self.state_2.time, self.state_1.location))
 
 class Coop_Astar():
-    def __init__(self, dimension, agents, obstacles):
+    def __init__(self, dimension, agents, obstacles, heuristic_cache=None):
         self.dimension = dimension
         self.obstacles = obstacles
+        self.grid_map = GridMap(dimension, obstacles)
+        self.distance_table = DistanceTable(self.grid_map, heuristic_cache)
+        # reservation tables of packed state/transition keys, and cell -> time an agent parks there
         self.agent_obstacles = set()
-        self.end_obstacles = set()
+        self.agent_transitions = set()
+        self.end_obstacles = {}
         self.max_t = 0
+        # with a horizon, agents are not planned more than this many timesteps
+        # after the last reserved one, so a search fails instead of running forever
+        self.time_horizon = None
+        # wall-clock time at which the planning gives up
+        self.deadline = None
+        # states expanded by the low-level searches of the last solution
+        self.expanded = 0
 
         self.agents = agents
         self.agent_dict = {}
+        self.heuristic_dict = {}
         self.curr_agent = -1
 
         self.make_agent_dict()
@@ -71,26 +67,16 @@ class Coop_Astar():
 
     def get_neighbors(self, state):
         neighbors = []
-
-        # Wait action
-        n = State(state.time + 1, state.location)
-        if self.state_valid(n):
-            neighbors.append(n)
-        # Up action
-        n = State(state.time + 1, Location(state.location.x, state.location.y+1))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
-        # Down action
-        n = State(state.time + 1, Location(state.location.x, state.location.y-1))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
-        # Left action
-        n = State(state.time + 1, Location(state.location.x-1, state.location.y))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
-        # Right action
-        n = State(state.time + 1, Location(state.location.x+1, state.location.y))
-        if self.state_valid(n) and self.transition_valid(state, n):
+        time = state.time + 1
+        if self.time_horizon is not None and time > self.max_t + self.time_horizon:
+            return neighbors
+        # wait, up, down, left and right moves into free cells come from the map
+        for location in self.grid_map.get_moves(state.location):
+            n = State(time, location)
+            if not self.reservation_valid(n):
+                continue
+            if location.key != state.location.key and not self.transition_valid(state, n):
+                continue
             neighbors.append(n)
         return neighbors
 
@@ -101,31 +87,31 @@ class Coop_Astar():
             return solution[agent_name][-1]
 
     def state_valid(self, state):
-        in_bounds = state.location.x >= 0 and state.location.x < self.dimension[0] \
-            and state.location.y >= 0 and state.location.y < self.dimension[1]
-        end_collision = False
-        for goal in self.end_obstacles:
-            if goal.location == state.location and goal.time <= state.time:
-                end_collision = True
-        if state.location == self.agent_dict[self.curr_agent]['goal'].location:
+        return self.grid_map.is_free(state.location.x, state.location.y) and self.reservation_valid(state)
+
+    def reservation_valid(self, state):
+        location = state.location
+        if state.key in self.agent_obstacles:
+            return False
+        parked_time = self.end_obstacles.get(location.key)
+        if parked_time is not None and parked_time <= state.time:
+            return False
+        if location == self.agent_dict[self.curr_agent]['goal'].location:
             for t in range(state.time, self.max_t):
-                if State(t, state.location) in self.agent_obstacles:
-                    end_collision = True
-        return in_bounds \
-            and (state.location.x, state.location.y) not in self.obstacles \
-            and State(state.time, Location(state.location.x, state.location.y)) not in self.agent_obstacles \
-            and not end_collision
+                if state_key(t, location.key) in self.agent_obstacles:
+                    return False
+        return True
 
     def transition_valid(self, state_1, state_2):
-        return Transition(state_1, state_2).reverse() not in self.agent_obstacles
+        return edge_key(state_1.time, state_2.location.key, state_1.location.key) not in self.agent_transitions
 
     def admissible_heuristic(self, state, agent_name):
-        goal = self.agent_dict[agent_name]["goal"]
-        return fabs(state.location.x - goal.location.x) + fabs(state.location.y - goal.location.y)
+        return self.heuristic_dict[agent_name][state.location.x][state.location.y]
 
     def is_at_goal(self, state, agent_name):
         goal_state = self.agent_dict[agent_name]["goal"]
-        return state.is_equal_except_time(goal_state)
+        # the start is never checked against the reservations, and the agent stays at its goal
+        return state.is_equal_except_time(goal_state) and self.reservation_valid(state)
 
     def make_agent_dict(self):
         for agent in self.agents:
@@ -133,20 +119,29 @@ class Coop_Astar():
             goal_state = State(0, Location(agent['goal'][0], agent['goal'][1]))
 
             self.agent_dict.update({agent['name']:{'start':start_state, 'goal':goal_state}})
+            self.heuristic_dict[agent['name']] = self.distance_table.get_heuristic(agent['goal'])
 
     def compute_solution(self):
         solution = {}
+        self.expanded = 0
         for agent in self.agent_dict.keys():
             self.curr_agent = agent
-            local_solution = self.a_star.search(agent)
+            start = self.agent_dict[agent]['start'].location
+            goal = self.agent_dict[agent]['goal'].location
+            if not self.grid_map.is_connected((start.x, start.y), (goal.x, goal.y)):
+                return False
+            if self.deadline is not None and time.time() >= self.deadline:
+                return False
+            local_solution = self.a_star.search(agent, deadline=self.deadline)
+            self.expanded += self.a_star.expanded
             if not local_solution:
                 return False
             solution.update({agent:local_solution})
             for i, state in enumerate(local_solution):
-                self.agent_obstacles.add(state)
+                self.agent_obstacles.add(state.key)
                 if i > 0:
-                    self.agent_obstacles.add(Transition(local_solution[i-1], state))
-            self.end_obstacles.add(local_solution[-1])
+                    self.agent_transitions.add(Transition(local_solution[i-1], state).key)
+            self.end_obstacles[local_solution[-1].location.key] = local_solution[-1].time
             self.max_t = max(self.max_t, local_solution[-1].time)
         if not solution:
             return {}
@@ -164,20 +159,20 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("param", help="input file containing map and obstacles")
     parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--heuristic-cache", default=None, help="directory to persist distance-to-goal tables in")
     args = parser.parse_args()
 
     # Read from input file
-    with open(args.param, 'r') as param_file:
-        try:
-            param = yaml.load(param_file, Loader=yaml.FullLoader)
-        except yaml.YAMLError as exc:
-            print(exc)
+    try:
+        param = load_instance(args.param)
+    except yaml.YAMLError as exc:
+        print(exc)
 
     dimension = param["map"]["dimensions"]
     obstacles = param["map"]["obstacles"]
     agents = param['agents']
 
-    ca = Coop_Astar(dimension, agents, obstacles)
+    ca = Coop_Astar(dimension, agents, obstacles, args.heuristic_cache)
 
     solution = ca.compute_solution()
     if not solution:
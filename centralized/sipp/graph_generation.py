@@ -8,9 +8,12 @@ See the article: 10.1109/ICRA.2011.5980306
 
 """
 
+import sys
+sys.path.append('../')
 import argparse
 import yaml
 from bisect import bisect
+from utils.grid_map import GridMap
 
 class State(object):
     def __init__(self, position=(-1,-1), t=0, interval=(0,float('inf'))):
@@ -20,94 +23,83 @@ class State(object):
 
 class SippGrid(object):
     def __init__(self):
-        # self.position = ()
+        # sorted, disjoint safe intervals of the cell
         self.interval_list = [(0, float('inf'))]
-        self.f = float('inf')
-        self.g = float('inf')
-        self.parent_state = State()
 
     def split_interval(self, t, last_t = False):
         """
-        Function to generate safe-intervals
+        Function to generate safe-intervals: the cell becomes unsafe at
+        time t, or from time t on if an obstacle stays there (last_t)
         """
-        for interval in self.interval_list:
-            if last_t:
-                if t<=interval[0]:
-                    self.interval_list.remove(interval)
-                elif t>interval[1]:
-                    continue
-                else:
-                    self.interval_list.remove(interval)
-                    self.interval_list.append((interval[0], t-1))
-            else:
-                if t == interval[0]:
-                    self.interval_list.remove(interval)
-                    if t+1 <= interval[1]:
-                        self.interval_list.append((t+1, interval[1]))
-                elif t == interval[1]:
-                    self.interval_list.remove(interval)
-                    if t-1 <= interval[0]:
-                        self.interval_list.append((interval[0],t-1))
-                elif bisect(interval,t) == 1:
-                    self.interval_list.remove(interval)
-                    self.interval_list.append((interval[0], t-1))
-                    self.interval_list.append((t+1, interval[1]))
-            self.interval_list.sort()
+        # last interval starting at or before t
+        i = bisect(self.interval_list, (t, float('inf'))) - 1
+        if last_t:
+            del self.interval_list[i+1:]
+        if i < 0 or self.interval_list[i][1] < t:
+            return
+        first, last = self.interval_list[i]
+        split = []
+        if first <= t-1:
+            split.append((first, t-1))
+        if not last_t and t+1 <= last:
+            split.append((t+1, last))
+        self.interval_list[i:i+1] = split
 
 class SippGraph(object):
-    def __init__(self, map):
+    def __init__(self, map, grid_map=None):
         self.map = map
         self.dimensions = map["map"]["dimensions"]
 
-        self.obstacles = [tuple(v) for v in map["map"]["obstacles"]]        
-        self.dyn_obstacles = map["dynamic_obstacles"]
+        if grid_map is None:
+            grid_map = GridMap(self.dimensions, map["map"]["obstacles"])
+        self.grid_map = grid_map
+        self.dyn_obstacles = dict(map.get("dynamic_obstacles") or {})
+        # (t, position at t, position at t+1) of every move of a dynamic obstacle
+        self.dyn_moves = set()
 
         self.sipp_graph = {}
         self.init_graph()
         self.init_intervals()
 
     def init_graph(self):
-        for i in range(self.dimensions[0]):
-            for j in range(self.dimensions[1]):
-                grid_dict = {(i,j):SippGrid()}
-                self.sipp_graph.update(grid_dict)
+        self.sipp_graph = {(i,j): SippGrid() for i in range(self.dimensions[0]) for j in range(self.dimensions[1])}
 
     def init_intervals(self):
-        if not self.dyn_obstacles: return
         for schedule in self.dyn_obstacles.values():
-            # for location in schedule:
-            for i in range(len(schedule)):
-                location = schedule[i]
-                last_t = i == len(schedule)-1
+            self.reserve(schedule)
 
-                position = (location["x"],location["y"])
-                t = location["t"]
-
-                self.sipp_graph[position].split_interval(t, last_t)
-                # print(str(position) + str(self.sipp_graph[position].interval_list))     
-
-    def is_valid_position(self, position):
-        dim_check = position[0] in range(self.dimensions[0]) and  position[1] in range(self.dimensions[1])
-        obs_check = position not in self.obstacles
-        # print(dim_check)
-        return dim_check and obs_check
-
-    def get_valid_neighbours(self, position):
-        neighbour_list = []
+    def reserve(self, schedule):
+        """
+        Removes the cells and moves of a schedule from the safe intervals,
+        the obstacle stays at its last location
+        """
+        for i in range(len(schedule)):
+            location = schedule[i]
+            last_t = i == len(schedule)-1
 
-        up = (position[0], position[1]+1)
-        if self.is_valid_position(up): neighbour_list.append(up)
+            position = (location["x"],location["y"])
+            t = location["t"]
 
-        down = (position[0], position[1]-1)
-        if self.is_valid_position(down): neighbour_list.append(down)
+            self.sipp_graph[position].split_interval(t, last_t)
+            if not last_t:
+                next_location = schedule[i+1]
+                next_position = (next_location["x"], next_location["y"])
+                if next_position != position and next_location["t"] == t+1:
+                    self.dyn_moves.add((t, position, next_position))
 
-        left = (position[0]-1, position[1])
-        if self.is_valid_position(left): neighbour_list.append(left)
+    def add_dynamic_obstacle(self, name, schedule):
+        """
+        Adds the schedule of a planned agent to the reservations, so the
+        next queries plan around it
+        """
+        self.dyn_obstacles[name] = schedule
+        self.reserve(schedule)
 
-        right = (position[0]+1, position[1])
-        if self.is_valid_position(right): neighbour_list.append(right)
+    def is_valid_position(self, position):
+        return self.grid_map.is_free(position[0], position[1])
 
-        return neighbour_list
+    def get_valid_neighbours(self, position):
+        return self.grid_map.get_neighbors(position)
 
 
 def main():
@@ -6,44 +6,184 @@ author: Ashwin Bose (@atb033)
 
 See the article: 10.1109/ICRA.2011.5980306
 
+Agents are planned one after the other, each around the paths of the
+agents planned before it. With several orderings, the YAML order, the
+farthest and nearest agents first and random orders are planned in
+parallel worker processes, which share the static map, and the cheapest
+complete schedule is kept.
+
 """
 
+import sys
+sys.path.append('../')
 import argparse
+import multiprocessing
+import os
+import random
+import time
 import yaml
 from math import fabs
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from graph_generation import SippGraph, State
 from sipp import SippPlanner
+from utils.grid_map import GridMap
+from utils.heuristic import DistanceTable
+from utils.instance import load_instance
+
+# set up by init_worker in each worker process
+worker_map = None
+worker_grid_map = None
+worker_cancel = None
+
+def init_worker(map, cancel):
+    global worker_map, worker_grid_map, worker_cancel
+    worker_map = map
+    worker_grid_map = GridMap(map["map"]["dimensions"], map["map"]["obstacles"])
+    worker_cancel = cancel
+
+def make_orderings(map, count, seed=0, heuristic_cache=None):
+    """
+    the YAML order, the agents farthest from and nearest to their goal
+    first, then random orders
+    """
+    agents = map["agents"]
+    grid_map = GridMap(map["map"]["dimensions"], map["map"]["obstacles"])
+    distance_table = DistanceTable(grid_map, heuristic_cache)
+    distances = [distance_table.get_distances(agent["goal"])[tuple(agent["start"])] for agent in agents]
+    yaml_order = list(range(len(agents)))
+    farthest_first = sorted(yaml_order, key=lambda i: -distances[i])
+    nearest_first = sorted(yaml_order, key=lambda i: distances[i])
+
+    orderings = []
+    for order in [yaml_order, farthest_first, nearest_first]:
+        if order not in orderings:
+            orderings.append(order)
+    rng = random.Random(seed)
+    while len(orderings) < count:
+        order = list(yaml_order)
+        rng.shuffle(order)
+        orderings.append(order)
+    return orderings[:count]
+
+def plan_ordering(order, heuristic_cache=None, deadline=None):
+    """
+    Runs in a worker process: plans the agents in the given order. Returns
+    the schedule, or None with the name of the agent that could not be
+    planned (None at the deadline or once cancelled), and the runtime.
+    """
+    start_time = time.time()
+    sipp_planner = SippPlanner(worker_map, order[0], heuristic_cache, worker_grid_map)
+    sipp_planner.verbose = False
+    schedule = {}
+    for i in order:
+        sipp_planner.set_agent(i)
+        if worker_cancel.is_set() or (deadline is not None and time.time() >= deadline):
+            return None, None, time.time() - start_time
+        if not sipp_planner.compute_plan():
+            return None, sipp_planner.name, time.time() - start_time
+        plan = sipp_planner.get_plan()
+        schedule.update(plan)
+        sipp_planner.add_dynamic_obstacle(sipp_planner.name, plan[sipp_planner.name])
+    return schedule, None, time.time() - start_time
+
+def compute_schedule_cost(schedule):
+    return sum([len(path) for path in schedule.values()])
+
+def search_orderings(map, orderings, workers=None, heuristic_cache=None, time_limit=None, first=False):
+    """
+    Plans the orderings in parallel. Returns the cheapest complete schedule,
+    or the first one with first, or None, and the search statistics.
+    """
+    start_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else None
+    best = None
+    runtimes = []
+    solved = 0
+    timed_out = 0
+    failed_agents = {}
+
+    cancel = multiprocessing.Event()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(map, cancel))
+    futures = [pool.submit(plan_ordering, order, heuristic_cache, deadline) for order in orderings]
+    for future in as_completed(futures):
+        if future.cancelled():
+            continue
+        schedule, failed_agent, runtime = future.result()
+        if schedule is None and failed_agent is None:
+            timed_out += 1
+            continue
+        runtimes.append(runtime)
+        if schedule is None:
+            failed_agents[failed_agent] = failed_agents.get(failed_agent, 0) + 1
+            continue
+        solved += 1
+        if best is None or compute_schedule_cost(schedule) < compute_schedule_cost(best):
+            best = schedule
+        if first or (deadline is not None and time.time() >= deadline):
+            break
+    # the orderings that did not start are dropped, the running ones stop before their next agent
+    cancel.set()
+    pool.shutdown(wait=True, cancel_futures=True)
+
+    stats = {'orderings': len(runtimes), 'solved': solved, 'timed_out': timed_out,
+             'success_rate': round(solved / len(runtimes), 3) if runtimes else 0.,
+             'time_per_ordering': round(sum(runtimes) / len(runtimes), 6) if runtimes else 0.,
+             'cost': compute_schedule_cost(best) if best is not None else -1,
+             'runtime': time.time() - start_time, 'failed_agents': failed_agents}
+    return best, stats
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("map", help="input file containing map and dynamic obstacles")
     parser.add_argument("output", help="output file with the schedule")
-    
+    parser.add_argument("--heuristic-cache", default=None, help="directory to persist distance-to-goal tables in")
+    parser.add_argument("--orderings", type=int, default=1,
+                        help="number of agent orderings to plan in parallel, 1 plans the YAML order")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--time-limit", type=float, default=None, help="wall-clock limit of the search in seconds")
+    parser.add_argument("--first", action='store_true', help="keep the first complete schedule instead of the cheapest")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random orderings")
+
     args = parser.parse_args()
-    
+
     # Read Map
-    with open(args.map, 'r') as map_file:
-        try:
-            map = yaml.load(map_file, Loader=yaml.FullLoader)
-        except yaml.YAMLError as exc:
-            print(exc)
+    try:
+        map = load_instance(args.map)
+    except yaml.YAMLError as exc:
+        print(exc)
 
     # Output file
     output = dict()
     output["schedule"] = dict()
 
+    if args.orderings > 1:
+        orderings = make_orderings(map, args.orderings, args.seed, args.heuristic_cache)
+        schedule, stats = search_orderings(map, orderings, args.workers, args.heuristic_cache,
+                                           args.time_limit, args.first)
+        print(', '.join([key + ': ' + str(value) for key, value in stats.items()]))
+        if schedule is None:
+            print(" Solution not found")
+            return
+        output["schedule"] = schedule
+        with open(args.output, 'w') as output_yaml:
+            yaml.safe_dump(output, output_yaml)
+        return
+
+    # one planner keeps the reservations, each planned path is added to them
+    sipp_planner = SippPlanner(map, 0, args.heuristic_cache)
+
     for i in range(len(map["agents"])):
-        sipp_planner = SippPlanner(map,i)
-    
+        sipp_planner.set_agent(i)
+
         if sipp_planner.compute_plan():
             plan = sipp_planner.get_plan()
             output["schedule"].update(plan)
-            map["dynamic_obstacles"].update(plan)
+            sipp_planner.add_dynamic_obstacle(sipp_planner.name, plan[sipp_planner.name])
+        else:
+            print("Plan not found for " + sipp_planner.name)
 
-            with open(args.output, 'w') as output_yaml:
-                yaml.safe_dump(output, output_yaml)  
-        else: 
-            print("Plan not found")
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
 
 
 if __name__ == "__main__":
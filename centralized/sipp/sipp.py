@@ -8,20 +8,42 @@ See the article: DOI: 10.1109/ICRA.2011.5980306
 
 """
 
+import sys
+sys.path.append('../')
 import argparse
 import yaml
-from math import fabs
+from heapq import heappush, heappop
 from graph_generation import SippGraph, State
+from utils.heuristic import DistanceTable
+from utils.instance import load_instance
 
 class SippPlanner(SippGraph):
-    def __init__(self, map, agent_id):
-        SippGraph.__init__(self, map)
-        self.start = tuple(map["agents"][agent_id]["start"])
-        self.goal = tuple(map["agents"][agent_id]["goal"])
-        self.name = map["agents"][agent_id]["name"]
-        self.open = []
+    def __init__(self, map, agent_id, heuristic_cache=None, grid_map=None):
+        SippGraph.__init__(self, map, grid_map)
+        self.distance_table = DistanceTable(self.grid_map, heuristic_cache)
+        # print a message for every plan found
+        self.verbose = True
+        # states expanded by the last search
+        self.expanded = 0
+        self.set_agent(agent_id)
+
+    def set_agent(self, agent_id):
+        """
+        Sets up the query of an agent on the current reservations
+        """
+        agent = self.map["agents"][agent_id]
+        self.start = tuple(agent["start"])
+        self.goal = tuple(agent["goal"])
+        self.name = agent["name"]
+        self.plan = []
+        self.heuristic = self.distance_table.get_heuristic(self.goal)
 
     def get_successors(self, state):
+        """
+        States reachable from a state, each at the earliest time of one of
+        the neighbour's safe intervals. The agent can leave until the end of
+        its own interval, and must not swap cells with a dynamic obstacle.
+        """
         successors = []
         m_time = 1
         neighbour_list = self.get_valid_neighbours(state.position)
@@ -30,60 +52,77 @@ class SippPlanner(SippGraph):
             start_t = state.time + m_time
             end_t = state.interval[1] + m_time
             for i in self.sipp_graph[neighbour].interval_list:
-                if i[0] > end_t or i[1] < start_t:
+                if i[0] > end_t:
+                    break
+                if i[1] < start_t:
+                    continue
+                time = max(start_t, i[0])
+                last_t = min(end_t, i[1])
+                while time <= last_t and (time - m_time, neighbour, state.position) in self.dyn_moves:
+                    time += 1
+                if time > last_t:
                     continue
-                time = max(start_t, i[0]) 
-                s = State(neighbour, time, i)
-                successors.append(s)
+                successors.append(State(neighbour, time, i))
         return successors
 
     def get_heuristic(self, position):
-        return fabs(position[0] - self.goal[0]) + fabs(position[1]-self.goal[1])
+        return self.heuristic[position[0]][position[1]]
 
     def compute_plan(self):
-        self.open = []
-        goal_reached = False
-        cost = 1
-
-        s_start = State(self.start, 0) 
-
-        self.sipp_graph[self.start].g = 0.
-        f_start = self.get_heuristic(self.start)
-        self.sipp_graph[self.start].f = f_start
-
-        self.open.append((f_start, s_start))
-
-        while (not goal_reached):
-            if self.open == {}: 
-                # Plan not found
-                return 0
-            s = self.open.pop(0)[1]
-            successors = self.get_successors(s)
-    
-            for successor in successors:
-                if self.sipp_graph[successor.position].g > self.sipp_graph[s.position].g + cost:
-                    self.sipp_graph[successor.position].g = self.sipp_graph[s.position].g + cost
-                    self.sipp_graph[successor.position].parent_state = s
-
-                    if successor.position == self.goal:
-                        print("Plan successfully calculated!!")
-                        goal_reached = True
-                        break
+        """
+        A* over (cell, safe interval) states, each reached at its earliest
+        time. The goal must be reached in its last interval, where the agent
+        can stay. Returns 1 and sets self.plan, or 0 if there is no plan.
+        """
+        self.expanded = 0
+        start_intervals = self.sipp_graph[self.start].interval_list
+        if not self.grid_map.is_connected(self.start, self.goal) or not start_intervals \
+                or start_intervals[0][0] > 0:
+            return 0
+
+        s_start = State(self.start, 0, start_intervals[0])
+        start_key = (self.start, s_start.interval)
+        # earliest arrival, parent and closed flag of each (cell, interval)
+        g = {start_key: 0}
+        states = {start_key: s_start}
+        parent = {}
+        closed = set()
+
+        # open list entries: (f, -g, insertion order, key), stale entries are skipped
+        counter = 0
+        open_heap = [(self.get_heuristic(self.start), 0, counter, start_key)]
+
+        while open_heap:
+            _, neg_g, _, key = heappop(open_heap)
+            if key in closed or -neg_g != g[key]:
+                continue
+            s = states[key]
+            if s.position == self.goal and s.interval[1] == float('inf'):
+                if self.verbose:
+                    print("Plan successfully calculated!!")
+                self.plan = [s]
+                while key in parent:
+                    key = parent[key]
+                    self.plan.append(states[key])
+                self.plan.reverse()
+                return 1
+            closed.add(key)
+            self.expanded += 1
+
+            for successor in self.get_successors(s):
+                successor_key = (successor.position, successor.interval)
+                if successor_key in closed or g.get(successor_key, float('inf')) <= successor.time:
+                    continue
+                g[successor_key] = successor.time
+                states[successor_key] = successor
+                parent[successor_key] = key
+                counter += 1
+                f = successor.time + self.get_heuristic(successor.position)
+                heappush(open_heap, (f, -successor.time, counter, successor_key))
 
-                    self.sipp_graph[successor.position].f = self.sipp_graph[successor.position].g + self.get_heuristic(successor.position)
-                    self.open.append((self.sipp_graph[successor.position].f, successor))
+        # Plan not found
+        return 0
 
-        # Tracking back
-        start_reached = False
-        self.plan = []
-        current = successor
-        while not start_reached:
-            self.plan.insert(0,current)
-            if current.position == self.start:
-                start_reached = True
-            current = self.sipp_graph[current.position].parent_state
-        return 1
-            
     def get_plan(self):
         path_list = []
 
@@ -114,21 +153,21 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("map", help="input file containing map and dynamic obstacles")
     parser.add_argument("output", help="output file with the schedule")
-    
+    parser.add_argument("--heuristic-cache", default=None, help="directory to persist distance-to-goal tables in")
+
     args = parser.parse_args()
     
-    with open(args.map, 'r') as map_file:
-        try:
-            map = yaml.load(map_file, Loader=yaml.FullLoader)
-        except yaml.YAMLError as exc:
-            print(exc)
+    try:
+        map = load_instance(args.map)
+    except yaml.YAMLError as exc:
+        print(exc)
 
 
     output = dict()
     output["schedule"] = dict()
 
     # compute first plan
-    sipp_planner = SippPlanner(map,0)
+    sipp_planner = SippPlanner(map, 0, args.heuristic_cache)
 
     if sipp_planner.compute_plan():
         plan = sipp_planner.get_plan()
@@ -0,0 +1,110 @@
+"""
+
+Static grid map shared by the centralized planners
+
+The YAML obstacle list is converted in bulk into a NumPy occupancy grid,
+from which a fixed 5-action (wait, up, down, left, right) neighbor table
+and the connected components of the free cells are precomputed once per
+map.
+
+"""
+import hashlib
+import numpy as np
+
+from utils.state import Location
+
+# wait, up, down, left, right
+ACTIONS = np.array([[0, 0], [0, 1], [0, -1], [-1, 0], [1, 0]], dtype=np.intp)
+
+def make_occupancy_grid(dimension, obstacles):
+    """
+    boolean grid indexed [x, y], True where there is an obstacle
+    """
+    grid = np.zeros((dimension[0], dimension[1]), dtype=bool)
+    if len(obstacles):
+        cells = np.asarray(obstacles, dtype=np.intp).reshape(-1, 2)
+        grid[cells[:, 0], cells[:, 1]] = True
+    return grid
+
+def grid_hash(grid):
+    digest = hashlib.sha1(np.array(grid.shape, dtype=np.int64).tobytes())
+    digest.update(np.packbits(grid).tobytes())
+    return digest.hexdigest()[:16]
+
+class GridMap(object):
+    def __init__(self, dimension, obstacles):
+        self.dimension = dimension
+        self.grid = make_occupancy_grid(dimension, obstacles)
+        self.hash = grid_hash(self.grid)
+        self.free = (~self.grid).tolist()
+        self.move_table = self.make_move_table()
+
+        # one shared Location per free cell, and the cells reachable with one action
+        self.locations = [[Location(x, y) if self.free[x][y] else None for y in range(dimension[1])]
+                          for x in range(dimension[0])]
+        self.moves = [[[] for _ in range(dimension[1])] for _ in range(dimension[0])]
+        self.neighbors = [[[] for _ in range(dimension[1])] for _ in range(dimension[0])]
+        for x, y, action in np.argwhere(self.move_table).tolist():
+            dx, dy = ACTIONS[action].tolist()
+            self.moves[x][y].append(self.locations[x+dx][y+dy])
+            if action:
+                self.neighbors[x][y].append((x+dx, y+dy))
+        # connected component of each free cell, -1 on obstacles
+        self.components = self.label_components()
+
+    def make_move_table(self):
+        """
+        boolean array [x, y, action], True if the action leads from a free
+        cell to a free cell inside the map
+        """
+        width, height = self.grid.shape
+        padded = np.ones((width + 2, height + 2), dtype=bool)
+        padded[1:-1, 1:-1] = self.grid
+        move_table = np.zeros((width, height, len(ACTIONS)), dtype=bool)
+        for action, (dx, dy) in enumerate(ACTIONS.tolist()):
+            move_table[:, :, action] = ~padded[1+dx:width+1+dx, 1+dy:height+1+dy]
+        move_table &= ~self.grid[:, :, None]
+        return move_table
+
+    def label_components(self):
+        components = [[-1] * self.dimension[1] for _ in range(self.dimension[0])]
+        label = 0
+        for x, y in np.argwhere(~self.grid).tolist():
+            if components[x][y] != -1:
+                continue
+            components[x][y] = label
+            stack = [(x, y)]
+            while stack:
+                position = stack.pop()
+                for nx, ny in self.neighbors[position[0]][position[1]]:
+                    if components[nx][ny] == -1:
+                        components[nx][ny] = label
+                        stack.append((nx, ny))
+            label += 1
+        return components
+
+    def is_connected(self, position_1, position_2):
+        """
+        True if both positions are free cells of the same connected component
+        """
+        if not self.is_free(position_1[0], position_1[1]) or not self.is_free(position_2[0], position_2[1]):
+            return False
+        return self.components[position_1[0]][position_1[1]] == self.components[position_2[0]][position_2[1]]
+
+    def is_free(self, x, y):
+        return 0 <= x < self.dimension[0] and 0 <= y < self.dimension[1] and self.free[x][y]
+
+    def get_location(self, x, y):
+        return self.locations[x][y]
+
+    def get_moves(self, location):
+        """
+        locations reachable from a location with one action, waiting first
+        """
+        return self.moves[location.x][location.y]
+
+    def get_neighbors(self, position):
+        """
+        adjacent free cells of a position, as (x, y) tuples
+        """
+        return self.neighbors[position[0]][position[1]]
@@ -0,0 +1,97 @@
+"""
+
+True-distance heuristic tables shared by the centralized planners
+
+Exact obstacle-aware distances to a goal are computed with a backward BFS
+over the occupancy grid. Tables are kept in an in-memory LRU keyed by
+(map hash, goal) and can be persisted as memory-mapped .npy files.
+
+"""
+import os
+from collections import OrderedDict
+import numpy as np
+
+UNREACHABLE = -1
+CACHE_SIZE = 1024
+
+_distance_cache = OrderedDict()
+
+def compute_distance_grid(grid, goal):
+    """
+    BFS wavefront from the goal over the free cells, UNREACHABLE elsewhere
+    """
+    free = ~grid
+    distances = np.full(grid.shape, UNREACHABLE, dtype=np.int32)
+    if not free[goal]:
+        return distances
+    visited = np.zeros(grid.shape, dtype=bool)
+    frontier = np.zeros(grid.shape, dtype=bool)
+    frontier[goal] = True
+    d = 0
+    while frontier.any():
+        distances[frontier] = d
+        visited |= frontier
+        expanded = np.zeros(grid.shape, dtype=bool)
+        expanded[1:, :] |= frontier[:-1, :]
+        expanded[:-1, :] |= frontier[1:, :]
+        expanded[:, 1:] |= frontier[:, :-1]
+        expanded[:, :-1] |= frontier[:, 1:]
+        frontier = expanded & free & ~visited
+        d += 1
+    return distances
+
+class DistanceTable(object):
+    """
+    Distance-to-goal grids of one map, looked up by goal cell
+    """
+    def __init__(self, grid_map, cache_dir=None):
+        self.grid = grid_map.grid
+        self.map_hash = grid_map.hash
+        self.cache_dir = cache_dir
+
+    def get_distances(self, goal):
+        goal = (int(goal[0]), int(goal[1]))
+        key = (self.map_hash, goal)
+        distances = _distance_cache.get(key)
+        if distances is not None:
+            _distance_cache.move_to_end(key)
+            return distances
+
+        distances = self.load(goal)
+        if distances is None:
+            distances = compute_distance_grid(self.grid, goal)
+            self.save(goal, distances)
+
+        _distance_cache[key] = distances
+        if len(_distance_cache) > CACHE_SIZE:
+            _distance_cache.popitem(last=False)
+        return distances
+
+    def get_heuristic(self, goal):
+        """
+        distances as nested lists indexed [x][y] for O(1) lookups in the
+        low-level searches, unreachable cells are infinitely far
+        """
+        return [[float('inf') if d == UNREACHABLE else d for d in column]
+                for column in self.get_distances(goal).tolist()]
+
+    def get_file_name(self, goal):
+        return os.path.join(self.cache_dir, self.map_hash + '_' + str(goal[0]) + '_' + str(goal[1]) + '.npy')
+
+    def load(self, goal):
+        if self.cache_dir is None:
+            return None
+        file_name = self.get_file_name(goal)
+        if not os.path.exists(file_name):
+            return None
+        return np.load(file_name, mmap_mode='r')
+
+    def save(self, goal, distances):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        file_name = self.get_file_name(goal)
+        temp_name = file_name + '.' + str(os.getpid()) + '.tmp'
+        with open(temp_name, 'wb') as temp_file:
+            np.save(temp_file, distances)
+        os.replace(temp_name, file_name)
@@ -0,0 +1,122 @@
+"""
+
+Instance loading for the centralized planners
+
+Instances are either the usual YAML files, parsed with the C libyaml
+loader when it is available, or compiled .npz bundles holding one or more
+instances as flat integer arrays. An instance inside a bundle is
+addressed as "bundle.npz:name"; the name can be omitted for a bundle
+holding a single instance.
+
+"""
+import os
+import yaml
+import numpy as np
+
+YamlLoader = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+
+BUNDLE_EXTENSION = '.npz'
+
+# bundles already read by this process
+_bundles = {}
+
+def load_yaml(file_name):
+    with open(file_name, 'r') as yaml_file:
+        return yaml.load(yaml_file, Loader=YamlLoader)
+
+def split_bundle_path(path):
+    """
+    "bundle.npz:name" -> ("bundle.npz", "name")
+    """
+    index = path.rfind(BUNDLE_EXTENSION + ':')
+    if index < 0:
+        return path, None
+    index += len(BUNDLE_EXTENSION)
+    return path[:index], path[index+1:]
+
+def is_bundle(path):
+    return split_bundle_path(path)[0].endswith(BUNDLE_EXTENSION)
+
+def load_instance(path):
+    """
+    dict in the YAML layout: map (dimensions, obstacles), agents and dynamic_obstacles
+    """
+    if not is_bundle(path):
+        return load_yaml(path)
+    file_name, name = split_bundle_path(path)
+    bundle = _bundles.get(file_name)
+    if bundle is None:
+        bundle = _bundles[file_name] = InstanceBundle(file_name)
+    return bundle.get_instance(name)
+
+def compile_instances(params, names):
+    """
+    flat arrays for a list of instances, indexed through per-instance offsets
+    """
+    arrays = {'names': np.array(names, dtype=str),
+              'dimensions': np.array([param["map"]["dimensions"] for param in params], dtype=np.int32).reshape(-1, 2)}
+
+    obstacles = [np.asarray(param["map"]["obstacles"] or [], dtype=np.int32).reshape(-1, 2) for param in params]
+    arrays['obstacle_offsets'] = np.cumsum([0] + [len(o) for o in obstacles], dtype=np.int64)
+    arrays['obstacles'] = np.concatenate(obstacles) if obstacles else np.zeros((0, 2), dtype=np.int32)
+
+    agents = [agent for param in params for agent in param["agents"]]
+    arrays['agent_offsets'] = np.cumsum([0] + [len(param["agents"]) for param in params], dtype=np.int64)
+    arrays['agent_names'] = np.array([agent['name'] for agent in agents], dtype=str)
+    arrays['starts'] = np.array([agent['start'] for agent in agents], dtype=np.int32).reshape(-1, 2)
+    arrays['goals'] = np.array([agent['goal'] for agent in agents], dtype=np.int32).reshape(-1, 2)
+
+    dyn_obstacles = [list((param.get("dynamic_obstacles") or {}).items()) for param in params]
+    schedules = [schedule for dyn in dyn_obstacles for _, schedule in dyn]
+    arrays['dyn_offsets'] = np.cumsum([0] + [len(dyn) for dyn in dyn_obstacles], dtype=np.int64)
+    arrays['dyn_names'] = np.array([name for dyn in dyn_obstacles for name, _ in dyn], dtype=str)
+    arrays['dyn_path_offsets'] = np.cumsum([0] + [len(schedule) for schedule in schedules], dtype=np.int64)
+    arrays['dyn_paths'] = np.array([[s['t'], s['x'], s['y']] for schedule in schedules for s in schedule],
+                                   dtype=np.int32).reshape(-1, 3)
+    return arrays
+
+def save_bundle(file_name, params, names):
+    np.savez(file_name, **compile_instances(params, names))
+
+class InstanceBundle(object):
+    def __init__(self, file_name):
+        with np.load(file_name) as data:
+            self.arrays = {key: data[key] for key in data.files}
+        self.names = self.arrays['names'].tolist()
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def get_instance(self, name=None):
+        if name is None:
+            if len(self.names) != 1:
+                raise KeyError("bundle holds " + str(len(self.names)) + " instances, an instance name is required")
+            i = 0
+        else:
+            i = self.index[name]
+        a = self.arrays
+
+        o_begin, o_end = a['obstacle_offsets'][i], a['obstacle_offsets'][i+1]
+        a_begin, a_end = a['agent_offsets'][i], a['agent_offsets'][i+1]
+        agents = [{'name': agent_name, 'start': start, 'goal': goal} for agent_name, start, goal in
+                  zip(a['agent_names'][a_begin:a_end].tolist(), a['starts'][a_begin:a_end].tolist(),
+                      a['goals'][a_begin:a_end].tolist())]
+
+        dyn_obstacles = {}
+        for j in range(a['dyn_offsets'][i], a['dyn_offsets'][i+1]):
+            p_begin, p_end = a['dyn_path_offsets'][j], a['dyn_path_offsets'][j+1]
+            dyn_obstacles[str(a['dyn_names'][j])] = [{'t': t, 'x': x, 'y': y} for t, x, y in a['dyn_paths'][p_begin:p_end].tolist()]
+
+        return {'map': {'dimensions': a['dimensions'][i].tolist(), 'obstacles': a['obstacles'][o_begin:o_end]},
+                'agents': agents,
+                'dynamic_obstacles': dyn_obstacles}
+
+def list_instances(path):
+    """
+    addresses of all the instances of a bundle, or the path itself for YAML
+    """
+    if not is_bundle(path) or split_bundle_path(path)[1] is not None:
+        return [path]
+    with np.load(path) as data:
+        return [path + ':' + name for name in data['names'].tolist()]
+
+def instance_name(file_name):
+    return os.path.splitext(os.path.basename(file_name))[0]
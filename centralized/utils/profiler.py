@@ -0,0 +1,49 @@
+"""
+
+Search profiling for the centralized planners
+
+A SearchProfiler accumulates counters, per-agent counters and the time
+spent in named sections of a search, and can stream trace events to a
+file as JSON lines. Planners hold None instead of a profiler when
+profiling is disabled, so the only remaining cost is a None check.
+
+"""
+import json
+import time
+
+class SearchProfiler(object):
+    def __init__(self, trace_file=None):
+        self.trace_file = trace_file
+        self.start_time = time.perf_counter()
+        self.counters = {}
+        self.agent_counters = {}
+        self.timers = {}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def count_agent(self, name, agent, n=1):
+        counters = self.agent_counters.setdefault(name, {})
+        counters[agent] = counters.get(agent, 0) + n
+
+    def add_time(self, name, start):
+        """
+        start is the time.perf_counter() value at the beginning of the section
+        """
+        self.timers[name] = self.timers.get(name, 0.) + time.perf_counter() - start
+
+    def event(self, name, **fields):
+        if self.trace_file is None:
+            return
+        record = {'event': name, 'time': round(time.perf_counter() - self.start_time, 6)}
+        record.update(fields)
+        self.trace_file.write(json.dumps(record) + '\n')
+
+    def get_profile(self):
+        profile = dict(self.counters)
+        profile.update(self.agent_counters)
+        profile.update({'time_' + name: round(t, 6) for name, t in self.timers.items()})
+        return profile
+
+    def __str__(self):
+        return '\n'.join([key + ': ' + str(value) for key, value in self.get_profile().items()])
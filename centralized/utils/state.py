@@ -0,0 +1,54 @@
+"""
+
+Compact state representation shared by the centralized planners
+
+Cells, states and edges are packed into plain integers so that hashing and
+equality in sets/dicts never allocate. Coordinates must fit in CELL_BITS.
+
+"""
+
+CELL_BITS = 16
+STATE_BITS = 2 * CELL_BITS
+
+def cell_key(x, y):
+    return (x << CELL_BITS) + y
+
+def state_key(time, cell):
+    return (time << STATE_BITS) + cell
+
+def move_key(cell_1, cell_2):
+    return (cell_1 << STATE_BITS) + cell_2
+
+def edge_key(time, cell_1, cell_2):
+    return (((time << STATE_BITS) + cell_1) << STATE_BITS) + cell_2
+
+def unpack_cell(cell):
+    return cell >> CELL_BITS, cell & ((1 << CELL_BITS) - 1)
+
+class Location(object):
+    __slots__ = ('x', 'y', 'key')
+    def __init__(self, x=-1, y=-1):
+        self.x = x
+        self.y = y
+        self.key = (x << CELL_BITS) + y
+    def __eq__(self, other):
+        return self.key == other.key
+    def __hash__(self):
+        return self.key
+    def __str__(self):
+        return str((self.x, self.y))
+
+class State(object):
+    __slots__ = ('time', 'location', 'key')
+    def __init__(self, time, location):
+        self.time = time
+        self.location = location
+        self.key = (time << STATE_BITS) + location.key
+    def __eq__(self, other):
+        return self.key == other.key
+    def __hash__(self):
+        return self.key
+    def is_equal_except_time(self, state):
+        return self.location.key == state.location.key
+    def __str__(self):
+        return str((self.time, self.location.x, self.location.y))